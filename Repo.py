@@ -1,22 +1,27 @@
 import os
+import re
 import sys
-from shutil import copyfile
-from xml.dom.minidom import parse
-from xml.dom.minidom import parseString
+from shutil import copyfile, move, rmtree
 import xml.etree.ElementTree as ET
 import TestObjects
 import mvn
-from pom_file import Pom
+from pom_file import Pom, PomEditError, add_pom_values, edit_pom_files, edit_surefire_plugins, parse_pom, write_pom
 from jcov_tracer import JcovTracer
 from jcov_parser import JcovParser
+from reactor import Reactor, ReactorBuildResult, get_overlay_pom_path, remove_overlay_poms, run_in_dependency_order, write_overlay_poms
+from sharding import get_test_classes_costs, plan_shards
+from build_cache import BuildCache
+import threading
 from junitparser.junitparser import Error, Failure
 import tempfile
+import multiprocessing
 
 
 class TestResult(object):
     def __init__(self, junit_test, suite_name=None):
         self.junit_test = junit_test
-        self.classname = junit_test.classname or suite_name
+        # the reports of reruns and shards have the suffix of their run in the class name
+        self.classname, _ = TestObjects.split_report_name_suffix(junit_test.classname or suite_name)
         self.name = junit_test.name
         self.time = junit_test.time
         self.full_name = "{classname}.{name}".format(classname=self.classname, name=self.name)
@@ -40,37 +45,258 @@ class TestResult(object):
         return {'_tast_name': self.full_name, '_outcome': self.outcome}
 
 
+class TestReruns(object):
+    REPORT_NAME_SUFFIX = 'rerun{0}'
+    MISSING = 'missing'
+
+    def __init__(self, test_result):
+        self.test = test_result
+        self.mvn_name = "{classname}#{name}".format(classname=test_result.classname, name=test_result.name)
+        self.outcomes = [test_result.outcome]
+
+    # Adds the outcome of a rerun. test_result is None if the test was not run
+    def add(self, test_result):
+        self.outcomes.append(test_result.outcome if test_result is not None else TestReruns.MISSING)
+
+    def get_known_outcomes(self):
+        return filter(lambda outcome: outcome != TestReruns.MISSING, self.outcomes)
+
+    @property
+    def reruns(self):
+        return len(self.outcomes) - 1
+
+    # Number of times the test changed from passing to failing or back
+    @property
+    def flips(self):
+        passed = map(lambda outcome: outcome == 'pass', self.get_known_outcomes())
+        return sum(map(lambda pair: pair[0] != pair[1], zip(passed, passed[1:])))
+
+    def has_passed(self):
+        return 'pass' in self.outcomes
+
+    def is_flaky(self):
+        return self.flips > 0
+
+    def __repr__(self):
+        return "{mvn_name}: {outcomes}".format(mvn_name=self.mvn_name, outcomes=self.outcomes)
+
+    def as_dict(self):
+        return {'_tast_name': self.test.full_name, '_outcomes': self.outcomes, '_flips': self.flips}
+
+
 class Repo(object):
-    def __init__(self, repo_dir):
+    # With overlay the poms of the repo are never edited: edits go to copies of the poms (see get_pom_to_edit),
+    # and the mvn commands build the copies
+    def __init__(self, repo_dir, use_build_cache=False, build_cache_dir=None, overlay=False):
         self._repo_dir = repo_dir
         self.DEFAULT_ES_VERSION = '1.0.6'
         self.DEFAULT_SUREFIRE_VERSION = '2.17'
         self.DEFAULT_JUNIT_VERSION = '4.12'
         self.build_report = None
+        self.build_cache = None
+        if use_build_cache:
+            self.build_cache = BuildCache(repo_dir, build_cache_dir)
+        self._build_has_compilation_error = None
+        self.compilation_errors = []
+        self.pom_edit_errors = {}
+        self.build_result = None
+        self._reactor = None
+        self.overlay = overlay
+        self._overlay_root = None
+        self._overlay_stats = {}
 
     @property
     def repo_dir(self):
         return self._repo_dir
 
     # Executes mvn test
-    def install(self, module=None, testcases=[], time_limit=sys.maxint, debug=False, tests_to_run=None, env=None):
-        self.change_surefire_ver()
+    # With fail_fast the build is killed as soon as a compilation error is reported. The errors are in self.compilation_errors
+    # The poms whose surefire version could not be set are built as they are. Their errors are in self.pom_edit_errors
+    def install(self, module=None, testcases=[], time_limit=sys.maxint, debug=False, tests_to_run=None, env=None, use_build_cache=True, fail_fast=False):
         inspected_module = self.repo_dir
         if module is not None:
             inspected_module = module
         install_cmd = self.generate_mvn_install_cmd(module=inspected_module, testcases=testcases, debug=debug, tests_to_run=tests_to_run)
-        build_report = mvn.wrap_mvn_cmd(install_cmd, time_limit=time_limit, dir=self._repo_dir, env=env)
+        try:
+            self.set_build_surefire_ver(mvn.get_surefire_version(install_cmd))
+            build_report = self.wrap_cached_mvn_cmd(install_cmd, time_limit=time_limit, dir=self._repo_dir, env=env, use_build_cache=use_build_cache, fail_fast=fail_fast)
+        finally:
+            mvn.remove_tests_selection_files(install_cmd)
         return build_report
 
     # Executes mvn test
-    def test(self, module=None, tests=[], time_limit=sys.maxint):
+    def test(self, module=None, tests=[], time_limit=sys.maxint, fail_fast=False):
         inspected_module = self.repo_dir
         if not module == None:
             inspected_module = module
         test_cmd = self.generate_mvn_test_cmd(module=inspected_module, tests=tests)
-        build_report = mvn.wrap_mvn_cmd(test_cmd, time_limit=time_limit)
+        try:
+            if mvn.has_method_patterns(test_cmd):
+                self.set_build_surefire_ver(mvn.SUREFIRE_METHOD_PATTERNS_VERSION)
+            build_report = self.wrap_cached_mvn_cmd(test_cmd, time_limit=time_limit, use_build_cache=False, fail_fast=fail_fast)
+        finally:
+            mvn.remove_tests_selection_files(test_cmd)
         return build_report
 
+    # Runs goal on every module of the reactor (or only on modules) as a separate mvn process, at most max_workers
+    # processes at once. A module starts after the modules it depends on are done, so goal should install them
+    def parallel_install(self, modules=None, max_workers=None, goal='install', time_limit=sys.maxint, env=None):
+        reactor = self.get_reactor()
+        if modules is not None:
+            modules = map(lambda module: reactor.get_module_by_path(module) if os.path.isdir(module) else reactor.get_module(module), modules)
+
+        def run_module(module):
+            return mvn.wrap_mvn_cmd(self.get_mvn_cmd(self.generate_mvn_reactor_module_cmd(module, goal)), time_limit=time_limit, dir=self._repo_dir, env=env)
+
+        module_reports = run_in_dependency_order(reactor, run_module, max_workers or multiprocessing.cpu_count(), modules)
+        built_modules = reactor.get_build_order(modules)
+        test_results = {}
+        for module in built_modules:
+            test_results.update(self.observe_tests(module.get_surefire_files()))
+        result = ReactorBuildResult(built_modules, module_reports, test_results)
+        self.build_report = result.build_report
+        return result
+
+    # Splits the test classes of the repo (or of module) to shards of about the same time by the current surefire reports
+    def plan_test_shards(self, shards_count, module=None, reports=None, default_cost=None):
+        if reports is None:
+            reports = self.get_tests_reports()
+        return plan_shards(self.get_tests(module), get_test_classes_costs(reports), shards_count, default_cost)
+
+    # Runs every shard as a parallel mvn surefire:test process. The surefire reports of every shard are moved
+    # to reports_dir/<shard suffix>
+    def run_shards(self, shards, reports_dir, time_limit=sys.maxint, compile_first=True):
+        if compile_first:
+            self.test_compile()
+        errors = []
+
+        def run_shard(shard):
+            try:
+                shard_cmd = self.generate_mvn_shard_cmd(shard)
+                try:
+                    shard.build_report = mvn.wrap_mvn_cmd(self.get_mvn_cmd(shard_cmd), time_limit=time_limit, dir=self._repo_dir)
+                finally:
+                    mvn.remove_tests_selection_files(shard_cmd)
+                shard.reports_dir = self.collect_shard_reports(shard, reports_dir)
+            except Exception as e:
+                errors.append(e)
+
+        threads = map(lambda shard: threading.Thread(target=run_shard, args=(shard,)), shards)
+        map(lambda thread: thread.start(), threads)
+        map(lambda thread: thread.join(), threads)
+        if errors:
+            raise errors[0]
+        return shards
+
+    # Moves the surefire reports of shard from the modules to their own directory
+    def collect_shard_reports(self, shard, reports_dir):
+        return self.collect_suffixed_reports(shard.report_name_suffix, reports_dir)
+
+    # Moves the surefire reports written with -Dsurefire.reportNameSuffix=suffix from the modules to reports_dir/suffix
+    def collect_suffixed_reports(self, suffix, reports_dir):
+        suffix_reports_dir = os.path.join(reports_dir, suffix)
+        if not os.path.isdir(suffix_reports_dir):
+            os.makedirs(suffix_reports_dir)
+        for module in self.get_reactor().get_all_modules():
+            surefire_dir = os.path.join(module.path, 'target', 'surefire-reports')
+            if not os.path.isdir(surefire_dir):
+                continue
+            for name in filter(lambda name: '-' + suffix + '.' in name, os.listdir(surefire_dir)):
+                move(os.path.join(surefire_dir, name), os.path.join(suffix_reports_dir, name))
+        return suffix_reports_dir
+
+    # Reruns only the failed tests of test_results (TestResult objects, or observe_tests() dict) by surefire:test,
+    # without building the modules again. Every test is rerun times times, also after it passes, so its flips are counted.
+    # Returns TestReruns by the full name of the test
+    def rerun_failed_tests(self, test_results, times=3, reports_dir=None, time_limit=sys.maxint):
+        if isinstance(test_results, dict):
+            test_results = test_results.values()
+        reruns = dict(map(lambda test: (test.full_name.lower(), TestReruns(test)), filter(lambda test: not test.is_passed(), test_results)))
+        remove_reports_dir = reports_dir is None
+        if remove_reports_dir:
+            reports_dir = tempfile.mkdtemp()
+        try:
+            to_rerun = reruns.values()
+            for ind in xrange(times if to_rerun else 0):
+                suffix = TestReruns.REPORT_NAME_SUFFIX.format(ind)
+                rerun_cmd = self.generate_mvn_rerun_cmd(map(lambda test_reruns: test_reruns.mvn_name, to_rerun), suffix)
+                try:
+                    mvn.wrap_mvn_cmd(self.get_mvn_cmd(rerun_cmd), time_limit=time_limit, dir=self._repo_dir)
+                finally:
+                    mvn.remove_tests_selection_files(rerun_cmd)
+                rerun_reports_dir = self.collect_suffixed_reports(suffix, reports_dir)
+                outcomes = self.observe_tests(map(lambda name: os.path.join(rerun_reports_dir, name),
+                                                  filter(lambda name: name.endswith('.xml'), os.listdir(rerun_reports_dir))))
+                for test_reruns in to_rerun:
+                    test_reruns.add(outcomes.get(test_reruns.test.full_name.lower()))
+        finally:
+            if remove_reports_dir:
+                rmtree(reports_dir, ignore_errors=True)
+        return reruns
+
+    # Returns the reactor of the repo. It is loaded again only if one of its poms changed
+    def get_reactor(self):
+        if self._reactor is None or self._reactor.is_stale():
+            self._reactor = Reactor(self._repo_dir)
+            # the copies of the poms that changed are written again by get_overlay_root
+            self._overlay_root = None
+        return self._reactor
+
+    # Writes the copies of the poms (see reactor.write_overlay_poms) and returns the copy of the root pom.
+    # A copy is written again only if its pom changed since it was copied (or it was removed), so the edits of the
+    # other copies are kept
+    def get_overlay_root(self):
+        reactor = self.get_reactor()
+        if self._overlay_root is None:
+            modules = filter(lambda module: not self.is_overlay_current(module.pom_path), reactor.get_all_modules())
+            self._overlay_root = write_overlay_poms(reactor, modules)
+            self._overlay_stats.update(map(lambda module: (module.pom_path, Reactor.get_pom_stat(module.pom_path)), modules))
+        return self._overlay_root
+
+    def remove_overlay(self):
+        remove_overlay_poms(self.get_reactor())
+        self._overlay_root = None
+        self._overlay_stats = {}
+
+    # Returns true if the copy of pom_path was written by this Repo, and pom_path did not change since
+    def is_overlay_current(self, pom_path):
+        pom_path = os.path.abspath(pom_path)
+        return pom_path in self._overlay_stats and self._overlay_stats[pom_path] == Reactor.get_pom_stat(pom_path) \
+            and os.path.isfile(get_overlay_pom_path(pom_path))
+
+    # Returns the pom that should be edited instead of pom_path: pom_path itself, or its copy in overlay mode
+    def get_pom_to_edit(self, pom_path):
+        if not self.overlay or not pom_path:
+            return pom_path
+        self.get_overlay_root()
+        if not self.is_overlay_current(pom_path):
+            # not a pom of the reactor
+            copyfile(pom_path, get_overlay_pom_path(pom_path))
+            self._overlay_stats[os.path.abspath(pom_path)] = Reactor.get_pom_stat(pom_path)
+        return get_overlay_pom_path(pom_path)
+
+    # Returns the pom that should be read instead of pom_path: its copy in overlay mode if it is current, pom_path otherwise.
+    # No copy is written
+    def get_pom_to_read(self, pom_path):
+        if self.overlay and pom_path and self.is_overlay_current(pom_path):
+            return get_overlay_pom_path(pom_path)
+        return pom_path
+
+    # In overlay mode, points the -f of cmd (the repo if cmd has none) at the copy of the pom
+    def get_mvn_cmd(self, cmd):
+        if not self.overlay:
+            return cmd
+        overlay_root = self.get_overlay_root()
+        match = re.search(r' -f (\S+)', cmd)
+        if match is None:
+            return cmd.replace('mvn ', 'mvn -f {0} '.format(overlay_root), 1)
+        pom_path = match.group(1)
+        if os.path.isdir(pom_path):
+            pom_path = os.path.join(pom_path, 'pom.xml')
+        if not os.path.isfile(get_overlay_pom_path(pom_path)):
+            return cmd
+        return cmd[:match.start(1)] + get_overlay_pom_path(pom_path) + cmd[match.end(1):]
+
     # Generates tests. As for now implemented with evosuite
     def generate_tests(self, module=None, classes=[], time_limit=sys.maxint):
         inspected_module = self.repo_dir
@@ -79,7 +305,7 @@ class Repo(object):
         if not self.tests_generator_setup(inspected_module):
             self.setup_tests_generator(inspected_module)
         test_cmd = self.generate_mvn_generate_tests_cmd(module=inspected_module, classes=classes)
-        build_report = mvn.wrap_mvn_cmd(test_cmd, time_limit=time_limit)
+        build_report = mvn.wrap_mvn_cmd(self.get_mvn_cmd(test_cmd), time_limit=time_limit)
         if os.path.exists(os.path.join(self.repo_dir, 'cutsFile.txt')):
             os.remove(os.path.join(self.repo_dir, 'cutsFile.txt'))
         return build_report
@@ -90,7 +316,9 @@ class Repo(object):
         if not module == None:
             inspected_module = module
         test_cmd = self.generate_mvn_clean_cmd(inspected_module)
-        build_report = mvn.wrap_mvn_cmd(test_cmd)
+        build_report = mvn.wrap_mvn_cmd(self.get_mvn_cmd(test_cmd))
+        if self.build_cache is not None:
+            self.build_cache.invalidate()
         return build_report
 
     # Executes mvn clean
@@ -98,18 +326,53 @@ class Repo(object):
         inspected_module = self.repo_dir
         if not module == None:
             inspected_module = module
-        build_report = mvn.wrap_mvn_cmd(self.generate_mvn_site_cmd(inspected_module))
+        build_report = mvn.wrap_mvn_cmd(self.get_mvn_cmd(self.generate_mvn_site_cmd(inspected_module)))
         return build_report
 
     # Executes mvn compile
-    def test_compile(self, module=None):
+    def test_compile(self, module=None, fail_fast=False):
         inspected_module = self.repo_dir
         if not module == None:
             inspected_module = module
         test_cmd = self.generate_mvn_test_compile_cmd(inspected_module)
-        self.build_report = mvn.wrap_mvn_cmd(test_cmd)
+        self.build_report = self.wrap_cached_mvn_cmd(test_cmd, fail_fast=fail_fast)
         return self.build_report
 
+    # Executes cmd, unless the build cache has a successful build of cmd on the current sources and poms.
+    # Then its build report (and compilation errors status) is reused.
+    # With fail_fast the build is killed after the first compilation errors report, and its partial report is returned.
+    # The mvn.BuildResult (times and peak memory) of an executed build is kept in build_result
+    def wrap_cached_mvn_cmd(self, cmd, time_limit=sys.maxint, dir=None, env=None, use_build_cache=True, fail_fast=False):
+        self._build_has_compilation_error = None
+        self.compilation_errors = []
+        self.pom_edit_errors = {}
+        self.build_result = None
+        cmd = self.get_mvn_cmd(cmd)
+        detector = mvn.CompilationErrorDetector(fail_fast)
+        if self.build_cache is None or not use_build_cache:
+            self.build_result = mvn.run_mvn_cmd(cmd, time_limit=time_limit, dir=dir, env=env, consumers=[detector])
+            self.compilation_errors = detector.get_compilation_errors()
+            return self.build_result.build_report
+        key = mvn.get_cmd_with_tests_selection(cmd) + repr(sorted((env or {}).items()))
+        cached = self.build_cache.get(key)
+        if cached is not None:
+            build_report, self._build_has_compilation_error = cached
+            if self._build_has_compilation_error:
+                self.compilation_errors = mvn.get_compilation_errors(mvn.get_compilation_error_report(build_report))
+            return build_report
+        self.build_result = mvn.run_mvn_cmd(cmd, time_limit=time_limit, dir=dir, env=env, consumers=[detector])
+        build_report = self.build_result.build_report
+        self.compilation_errors = detector.get_compilation_errors()
+        self._build_has_compilation_error = mvn.has_compilation_error(build_report)
+        self.build_cache.put(key, build_report, self._build_has_compilation_error)
+        return build_report
+
+    # Returns true if the last build report has compilation errors
+    def has_compilation_error(self):
+        if self._build_has_compilation_error is not None:
+            return self._build_has_compilation_error
+        return mvn.has_compilation_error(self.build_report)
+
     def get_test_results(self):
         from junitparser import JUnitXml
         from junitparser.junitparser import Error, Failure
@@ -221,28 +484,25 @@ class Repo(object):
         return os.path.join(os.environ['USERPROFILE'], '.m2\\repository')
 
     def setup_jcov_tracer(self, path_to_classes_file=None, path_to_out_template=None, target_dir=None, class_path=None,
-                          instrument_only_methods=True):
+                          instrument_only_methods=True, workers=None):
         result_file = "result.xml"
         if target_dir:
             result_file = os.path.join(target_dir, result_file)
         jcov = JcovTracer(self.repo_dir, path_to_out_template, path_to_classes_file, result_file, class_path=class_path,
                           instrument_only_methods=instrument_only_methods)
-        for pom_file in self.get_all_pom_paths(self._repo_dir):
-            pom = Pom(pom_file)
-            for value in jcov.get_values_to_add():
-                pom.add_pom_value(value)
+        self.edit_poms(add_pom_values, self.get_all_pom_paths(self._repo_dir), (jcov.get_values_to_add(),), workers)
         return jcov
 
     def has_surefire(self):
         for pom_file in self.get_all_pom_paths(self._repo_dir):
-            pom = Pom(pom_file)
+            pom = Pom(self.get_pom_to_read(pom_file), batch=True)
             if pom.has_surefire():
                 return True
         return False
 
-    def run_under_jcov(self, target_dir, debug=False, instrument_only_methods=True, short_type=True, module=None, tests_to_run=None, check_comp_error=True, classes_to_trace=None):
-        self.test_compile()
-        if check_comp_error and mvn.has_compilation_error(self.build_report):
+    def run_under_jcov(self, target_dir, debug=False, instrument_only_methods=True, short_type=True, module=None, tests_to_run=None, check_comp_error=True, classes_to_trace=None, method_ids_cache_dir=None):
+        self.test_compile(fail_fast=check_comp_error)
+        if check_comp_error and self.has_compilation_error():
             return []
         f, path_to_classes_file = tempfile.mkstemp()
         os.close(f)
@@ -254,130 +514,55 @@ class Repo(object):
         if classes_to_trace:
             with open(path_to_classes_file, "wb") as f:
                 f.writelines(classes_to_trace)
-        self.build_report = self.install(debug=debug, module=module, tests_to_run=tests_to_run)
+        self.build_report = self.install(debug=debug, module=module, tests_to_run=tests_to_run, use_build_cache=False)
         jcov.stop_grabber()
+        parser = JcovParser(target_dir, instrument_only_methods, short_type, cache_dir=method_ids_cache_dir,
+                            template_path=path_to_template)
         os.remove(path_to_classes_file)
         os.remove(path_to_template)
-        return JcovParser(target_dir, instrument_only_methods, short_type).parse()
+        return parser.parse()
 
     # Changes all the pom files in a module recursively
+    # Returns the poms of the reactor modules in module (the whole repo by default).
+    # A module outside of the reactor of the repo is read as a reactor of its own
     def get_all_pom_paths(self, module=None):
-        ans = []
         inspected_module = self.repo_dir
         if module is not None:
             inspected_module = module
-        pom_path = os.path.join(inspected_module, 'pom.xml')
-        if os.path.isfile(pom_path):
-            try:
-                parse(pom_path)
-                ans.append(pom_path)
-            except:
-                pass
-        for file in os.listdir(inspected_module):
-            full_path = os.path.join(inspected_module, file)
-            if os.path.isdir(full_path):
-                ans.extend(self.get_all_pom_paths(full_path))
+        ans = self.get_reactor().get_pom_paths(inspected_module)
+        if not ans:
+            ans = Reactor(inspected_module).get_pom_paths()
         return ans
 
-    # Changes surefire version in a pom
-    def change_surefire_ver(self, version="2.18.1", module=None):
-        ans = []
+    # Changes surefire version in the poms of the repo (or of module), on a pool of workers processes (see edit_poms)
+    def change_surefire_ver(self, version=mvn.SUREFIRE_VERSION, module=None, workers=None):
         inspected_module = self.repo_dir
         if module is not None:
             inspected_module = module
-        poms = self.get_all_pom_paths(inspected_module)
-        new_file_lines = []
-        for pom in poms:
-            try:
-                xmlFile = parse(pom)
-            except:
-                pass
-                # assume that file is not valid pom
-            tmp_build_list = xmlFile.getElementsByTagName('build')
-            build_list = list(
-                filter(lambda b: not b.parentNode == None and b.parentNode.localName == 'project', tmp_build_list))
-            if len(build_list) == 0:
-                continue
-            assert len(build_list) == 1
-            plugins_tags = build_list[0].getElementsByTagName('plugins')
-            if len(plugins_tags) == 0:
-                continue
-            for plugins_tag in plugins_tags:
-                if plugins_tag.parentNode.localName == 'build':
-                    artifacts_ids = list(
-                        map(lambda a: str(a.firstChild.data), plugins_tag.getElementsByTagName('artifactId')))
-                    if not any(a_id == 'maven-surefire-plugin' for a_id in artifacts_ids):
-                        new_plugin = plugins_tag.ownerDocument.createElement(tagName='plugin')
-                        new_group_id = new_plugin.ownerDocument.createElement(tagName='groupId')
-                        new_artifact_id = new_plugin.ownerDocument.createElement(tagName='artifactId')
-                        new_group_id_text = new_group_id.ownerDocument.createTextNode('org.apache.maven.plugins')
-                        new_artifact_id_text = new_artifact_id.ownerDocument.createTextNode('maven-surefire-plugin')
-                        new_group_id.appendChild(new_group_id_text)
-                        new_plugin.appendChild(new_group_id)
-                        new_artifact_id.appendChild(new_artifact_id_text)
-                        new_plugin.appendChild(new_artifact_id)
-                        plugins_tag.appendChild(new_plugin)
-            for plugins_tag in plugins_tags:
-                mvn.change_plugin_version_if_exists(plugins_tag, 'maven-surefire-plugin', version)
-            os.remove(pom)
-            with open(pom, 'w+') as f:
-                tmp_str = xmlFile.toprettyxml()
-                copy_tmp_str = ''
-                for char in tmp_str[::]:
-                    if 125 < ord(char):
-                        copy_tmp_str += 'X'
-                    else:
-                        copy_tmp_str += char
-                lines = list(filter(lambda line: len(line) > 0, copy_tmp_str.split('\n')))
-                for line in lines:
-                    if not (all(c == ' ' for c in line) or all(c == '\t' for c in line)):
-                        f.write(line + '\n')
-
-    # Changes surefire version in a pom
-    def add_argline_to_surefire(self, content):
-        inspected_module = self.repo_dir
-        poms = self.get_all_pom_paths(inspected_module)
-        for pom in poms:
-            xmlFile = parse(pom)
-            tmp_build_list = xmlFile.getElementsByTagName('build')
-            build_list = list(
-                filter(lambda b: not b.parentNode == None and b.parentNode.localName == 'project', tmp_build_list))
-            if len(build_list) == 0:
-                continue
-            assert len(build_list) == 1
-            plugins_tags = build_list[0].getElementsByTagName('plugins')
-            if len(plugins_tags) == 0:
-                continue
-            for plugins_tag in plugins_tags:
-                if plugins_tag.parentNode.localName == 'build':
-                    artifacts_ids = list(
-                        map(lambda a: str(a.firstChild.data), plugins_tag.getElementsByTagName('artifactId')))
-                    if not any(a_id == 'maven-surefire-plugin' for a_id in artifacts_ids):
-                        new_plugin = plugins_tag.ownerDocument.createElement(tagName='plugin')
-                        new_group_id = new_plugin.ownerDocument.createElement(tagName='groupId')
-                        new_artifact_id = new_plugin.ownerDocument.createElement(tagName='artifactId')
-                        new_group_id_text = new_group_id.ownerDocument.createTextNode('org.apache.maven.plugins')
-                        new_artifact_id_text = new_artifact_id.ownerDocument.createTextNode('maven-surefire-plugin')
-                        new_group_id.appendChild(new_group_id_text)
-                        new_plugin.appendChild(new_group_id)
-                        new_artifact_id.appendChild(new_artifact_id_text)
-                        new_plugin.appendChild(new_artifact_id)
-                        plugins_tag.appendChild(new_plugin)
-            for plugins_tag in plugins_tags:
-                mvn.add_plugin_configuration_argline(plugins_tag, 'maven-surefire-plugin', content=content)
-            os.remove(pom)
-            with open(pom, 'w+') as f:
-                tmp_str = xmlFile.toprettyxml()
-                copy_tmp_str = ''
-                for char in tmp_str[::]:
-                    if 125 < ord(char):
-                        copy_tmp_str += 'X'
-                    else:
-                        copy_tmp_str += char
-                lines = list(filter(lambda line: len(line) > 0, copy_tmp_str.split('\n')))
-                for line in lines:
-                    if not (all(c == ' ' for c in line) or all(c == '\t' for c in line)):
-                        f.write(line + '\n')
+        return self.edit_poms(edit_surefire_plugins, self.get_all_pom_paths(inspected_module), (mvn.change_plugin_version_if_exists, version), workers)
+
+    # Changes surefire version in the poms of the repo before a build. The errors of the poms that could not be edited
+    # are kept in self.pom_edit_errors (by pom) instead of failing the build
+    def set_build_surefire_ver(self, version):
+        try:
+            self.change_surefire_ver(version)
+            self.pom_edit_errors = {}
+        except PomEditError as e:
+            self.pom_edit_errors = e.errors
+
+    # Sets the surefire argLine in the poms of the repo, on a pool of workers processes (see edit_poms)
+    def add_argline_to_surefire(self, content, workers=None):
+        return self.edit_poms(edit_surefire_plugins, self.get_all_pom_paths(self.repo_dir), (mvn.add_plugin_configuration_argline, content), workers)
+
+    # Calls function(pom, *args) on the poms to edit (see get_pom_to_edit) of pom_paths, on a pool of workers processes
+    # (serially for a few poms, see edit_pom_files).
+    # Every pom is edited even if others failed; then a PomEditError with the error of every failed pom is raised.
+    # Returns the results of function by pom
+    def edit_poms(self, function, pom_paths, args=(), workers=None):
+        results, errors = edit_pom_files(function, map(self.get_pom_to_edit, pom_paths), args, workers)
+        if errors:
+            raise PomEditError('failed to edit {0} of {1} poms'.format(len(errors), len(pom_paths)), errors)
+        return results
 
     def add_element_to_pom(self, pom_path, path, path_filter, element_name, element_value, add_new_element=True):
         """
@@ -413,7 +598,7 @@ class Repo(object):
         pass
 
     def run_function_on_poms_by_filter(self, pom_filter, function, *args, **kwargs):
-        map(lambda pom: function(pom, *args, **kwargs), filter(pom_filter, self.get_all_pom_paths(self._repo_dir)))
+        map(lambda pom: function(self.get_pom_to_edit(pom), *args, **kwargs), filter(pom_filter, self.get_all_pom_paths(self._repo_dir)))
 
     # Returns mvn command string that runns the given tests in the given module
     def generate_mvn_test_cmd(self, tests, module=None):
@@ -425,12 +610,31 @@ class Repo(object):
                 os.path.basename(module))
         # ans = 'mvn test surefire:test -DfailIfNoTests=false -Dmaven.test.failure.ignore=true -Dtest='
         ans += ' -DfailIfNoTests=false'
-        if len(mvn_names) > 0:
-            ans += ' -Dtest='
-            for mvn_name in mvn_names:
-                if not ans.endswith('='):
-                    ans += ','
-                ans += mvn_name
+        ans += mvn.get_mvn_tests_selection_args(mvn_names)
+        ans += ' -f ' + self.repo_dir
+        return ans
+
+    # Returns mvn command string that runs goal on a single reactor module, without the modules it depends on
+    def generate_mvn_reactor_module_cmd(self, module, goal='install'):
+        ans = 'mvn -pl {0}:{1} {2} -fn -Drat.skip=true -Drat.ignoreErrors=true -Drat.numUnapprovedLicenses=10000 -Djacoco.skip=true'.format(
+            module.group_id, module.artifact_id, goal)
+        ans += ' -DfailIfNoTests=false'
+        ans += ' -f ' + self.repo_dir
+        return ans
+
+    # Returns mvn command string that runs only the tests of shard, without building the modules again
+    def generate_mvn_shard_cmd(self, shard):
+        tests_selection_args = mvn.get_mvn_tests_selection_args(shard.get_mvn_names())
+        ans = 'mvn {0} -fn -DfailIfNoTests=false -Dsurefire.reportNameSuffix={1}'.format(mvn.get_surefire_test_goal(tests_selection_args), shard.report_name_suffix)
+        ans += tests_selection_args
+        ans += ' -f ' + self.repo_dir
+        return ans
+
+    # Returns mvn command string that reruns the given tests (Class#method) without building the modules again
+    def generate_mvn_rerun_cmd(self, tests_names, report_name_suffix):
+        tests_selection_args = mvn.get_mvn_tests_selection_args(tests_names)
+        ans = 'mvn {0} -fn -DfailIfNoTests=false -Dsurefire.reportNameSuffix={1}'.format(mvn.get_surefire_test_goal(tests_selection_args), report_name_suffix)
+        ans += tests_selection_args
         ans += ' -f ' + self.repo_dir
         return ans
 
@@ -465,15 +669,7 @@ class Repo(object):
         ans += ' -DfailIfNoTests=false'
         if debug:
             ans += ' -Dmaven.surefire.debug="-Xdebug -Xrunjdwp:transport=dt_socket,server=y,suspend=y,address=8000 -Xnoagent -Djava.compiler=NONE"'
-        if tests_to_run:
-            ans += " -Dtest="
-            ans += ','.join(tests_to_run)
-        if len(testcases) > 0:
-            ans += ' -Dtest='
-            for testclass in testclasses:
-                if not ans.endswith('='):
-                    ans += ','
-                ans += testclass.mvn_name
+        ans += mvn.get_mvn_tests_selection_args(list(tests_to_run or []) + map(lambda testclass: testclass.mvn_name, testclasses))
         # ans += ' -f ' + self.repo_dir
         return ans
 
@@ -513,8 +709,8 @@ class Repo(object):
     # Add tags to the pom. xquey is a string written in xpath aka xquery convention
     # Behaviour is unknown if the xquery doesn't refer to a single tag
     def set_pom_tag(self, xquery, value, module='', create_if_not_exist=False):
-        pom = self.get_pom(module)
-        root = ET.parse(pom).getroot()
+        pom = self.get_pom_to_edit(self.get_pom(module))
+        root = parse_pom(pom).getroot()
         xmlns, _ = mvn.tag_uri_and_name(root)
         if not xmlns == '':
             tmp_tags_1 = xquery.split('/')
@@ -526,7 +722,7 @@ class Repo(object):
 
     # Gets the tag specified in the xquery
     def get_pom_tag(self, xquery, module=''):
-        pom = self.get_pom(module)
+        pom = self.get_pom_to_read(self.get_pom(module))
         root = ET.parse(pom).getroot()
         xmlns, _ = mvn.tag_uri_and_name(root)
         if not xmlns == '':
@@ -563,27 +759,14 @@ class Repo(object):
                             create_if_not_exist=create_if_not_exist)
 
     def rewrite_pom(self, root, module=''):
-        pom = os.path.join(module, 'pom.xml')
-        rough_string = ET.tostring(root, 'utf-8')
-        reparsed = parseString(rough_string).toprettyxml().replace('</ns0:', '</').replace('<ns0:', '<')
-        os.remove(pom)
-        with open(pom, 'w+') as f:
-            tmp_str = reparsed
-            copy_tmp_str = ''
-            for char in tmp_str[::]:
-                if 125 < ord(char):
-                    copy_tmp_str += 'X'
-                else:
-                    copy_tmp_str += char
-            lines = list(filter(lambda line: len(line) > 0, copy_tmp_str.split('\n')))
-            for line in lines:
-                if not (all(c == ' ' for c in line) or all(c == '\t' for c in line)):
-                    f.write(line + '\n')
-
-    def observe_tests(self):
+        write_pom(self.get_pom_to_edit(os.path.join(module, 'pom.xml')), root)
+
+    def observe_tests(self, surefire_files=None):
         from junitparser import JUnitXml, junitparser
+        if surefire_files is None:
+            surefire_files = self.get_surefire_files()
         outcomes = {}
-        for report in self.get_surefire_files():
+        for report in surefire_files:
             try:
                 suite = JUnitXml.fromfile(report)
                 for case in suite:
@@ -721,14 +904,9 @@ class Repo(object):
         self.set_pom_tag(xquery=set_groupId_xquery, create_if_not_exist=True, module=module, value=groupId)
         self.set_pom_tag(xquery=set_version_xquery, create_if_not_exist=True, module=module, value=version)
 
-    def add_javadoc(self):
+    def add_javadoc(self, workers=None):
         from javadoc import JavaDoc
-        for pom_file in self.get_all_pom_paths(self._repo_dir):
-            pom = Pom(pom_file)
-            pom.set_site_version()
-            for value in JavaDoc.get_pom_values():
-                pom.add_pom_value(value, create_plugin_if_not_exists=True)
-            pom.save()
+        self.edit_poms(add_pom_values, self.get_all_pom_paths(self._repo_dir), (JavaDoc.get_pom_values(), True, True), workers)
 
     def javadoc_command(self, dump_path=None):
         from javadoc import JavaDoc
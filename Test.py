@@ -1,11 +1,24 @@
 import os
 import shutil
 import sys
+import tempfile
 import unittest
 import Repo
 import mvn
+import pom_file
 import xml.etree.ElementTree as ET
 import TestObjects
+import benchmarks
+import run_mvn
+from build_cache import BuildCache
+from build_events import BuildEvent, aggregate_breakdowns, parse_build_report
+from coverage_matrix import CoverageMatrixBuilder, CoverageMatrixError, Granularity, build_coverage_matrix
+from jcov_parser import JcovParser
+from pom_file import Pom, PomEditError, PomPlugin, PomValue, edit_pom_files, edit_surefire_plugins, write_pom
+from reactor import Reactor, ReactorError, run_in_dependency_order
+from sharding import get_default_cost, get_test_classes_costs, plan_shards
+from trace_information import HitInformation, HitInformationError, Signature, aggregate_edge_counts
+from trace_store import TraceStore, TraceStoreError, convert_xml_dir, write_trace_store
 
 orig_wd = os.getcwd()
 class Test_mvnpy(unittest.TestCase):
@@ -429,6 +442,820 @@ class Test_mvnpy(unittest.TestCase):
 
 
 
+class Test_jcov_parser(unittest.TestCase):
+    def setUp(self):
+        os.chdir(orig_wd)
+        self.traces_dir = os.path.join(os.getcwd(), 'static_files', 'jcov_traces')
+        self.parser = JcovParser(self.traces_dir)
+
+    def get_traces(self, traces):
+        return dict(map(lambda trace: (trace.test_name, trace), traces))
+
+    def test_stream_parse_same_as_parse(self):
+        self.parser.jcov_files = [os.path.join(self.traces_dir, 'test_a.xml')]
+        expected = list(self.parser.parse())[0]
+        result = list(self.parser.stream_parse())[0]
+        self.assertEqual(sorted(result.get_trace()), sorted(expected.get_trace()))
+        self.assertEqual(sorted(result.get_execution_edges()), sorted(expected.get_execution_edges()))
+        self.assertEqual(sorted(result.get_call_graph_edges()), sorted(expected.get_call_graph_edges()))
+
+    def test_stream_parse_different_layouts(self):
+        traces = self.get_traces(self.parser.stream_parse())
+        self.assertEqual(sorted(traces.keys()), ['test_a', 'test_b'])
+        self.assertEqual(sorted(traces['test_a'].get_trace()), ['org.example.Calc.Calc()', 'org.example.Calc.add(int;int)'])
+        self.assertEqual(sorted(traces['test_b'].get_trace()),
+                         ['org.example.Calc.Calc()', 'org.example.Calc.Calc_init()', 'org.example.Calc.sum(int[];List)'])
+        self.assertTrue(('org.example.Calc.Calc()', 'org.example.Calc.sum(int[];List)') in traces['test_b'].get_call_graph_edges())
+
+    def test_parallel_parse(self):
+        expected = self.get_traces(self.parser.stream_parse())
+        for ordered in [True, False]:
+            result = self.get_traces(self.parser.parallel_parse(2, ordered=ordered))
+            self.assertEqual(sorted(result.keys()), sorted(expected.keys()))
+            for test_name in expected:
+                self.assertEqual(sorted(result[test_name].get_trace()), sorted(expected[test_name].get_trace()))
+                self.assertEqual(sorted(result[test_name].get_execution_edges()),
+                                 sorted(expected[test_name].get_execution_edges()))
+
+    def test_compact_trace(self):
+        expected = self.get_traces(self.parser.stream_parse())
+        self.parser.compact = True
+        for traces in [self.parser.stream_parse(), self.parser.parallel_parse(2)]:
+            result = self.get_traces(traces)
+            for test_name in expected:
+                self.assertEqual(sorted(result[test_name].get_trace()), sorted(expected[test_name].get_trace()))
+                self.assertEqual(sorted(result[test_name].get_trace('files')), sorted(expected[test_name].get_trace('files')))
+                self.assertEqual(sorted(result[test_name].get_execution_edges()),
+                                 sorted(expected[test_name].get_execution_edges()))
+                self.assertEqual(sorted(result[test_name].get_call_graph_edges()),
+                                 sorted(expected[test_name].get_call_graph_edges()))
+
+    def test_decode_hit_information(self):
+        self.assertEqual(HitInformation.decode('[[1,-1,-1],[2,10,11]]').tolist(), [1, -1, -1, 2, 10, 11])
+        self.assertEqual(HitInformation.decode('[[1, 2, 3], [4, 5, 6]]').tolist(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(HitInformation.decode('[]').tolist(), [])
+        for malformed in ['', '[[1,2]]', '[[1,2,3],]', '[[1,2,3]', '__import__("os")', '[[1,2,3.5]]', '[1,2,3]', '[["a",2,3]]']:
+            self.assertRaises(HitInformationError, HitInformation.decode, malformed)
+
+    def test_method_ids_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            template = os.path.join(self.traces_dir, 'test_a.xml')
+            parser = JcovParser(self.traces_dir, cache_dir=cache_dir, template_path=template)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cached_parser = JcovParser(self.traces_dir, cache_dir=cache_dir, template_path=template)
+            self.assertEqual(cached_parser.method_name_by_id, parser.method_name_by_id)
+            self.assertEqual(cached_parser.method_name_by_id, self.parser.method_name_by_id)
+            JcovParser(self.traces_dir, cache_dir=cache_dir, template_path=os.path.join(self.traces_dir, 'test_b.xml'))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_edge_counts(self):
+        traces = self.get_traces(self.parser.stream_parse())
+        self.parser.compact = True
+        compact_traces = self.get_traces(self.parser.stream_parse())
+        init, add = 'org.example.Calc.Calc()', 'org.example.Calc.add(int;int)'
+        expected_execution = {('None', init): 1, (init, add): 1, (add, add): 1}
+        expected_call_graph = {('None', init): 1, ('None', add): 1, (init, add): 1}
+        for trace in [traces['test_a'], compact_traces['test_a']]:
+            self.assertEqual(dict(trace.get_edge_counts()), expected_execution)
+            self.assertEqual(dict(trace.get_edge_counts(HitInformation.CALL_GRAPH)), expected_call_graph)
+            self.assertEqual(dict(trace.get_edge_counts(by_id=True)), {(-1, 0): 1, (0, 1): 1, (1, 1): 1})
+        for edge_type in [HitInformation.EXECUTION, HitInformation.CALL_GRAPH]:
+            counts = aggregate_edge_counts(traces.values(), edge_type)
+            self.assertEqual(counts, aggregate_edge_counts(compact_traces.values(), edge_type))
+            self.assertEqual(sum(counts.values()), 8)
+
+    def test_trace_store(self):
+        store_dir = tempfile.mkdtemp()
+        try:
+            store_path = convert_xml_dir(self.traces_dir, os.path.join(store_dir, 'traces.bin'))
+            traces = self.get_traces(self.parser.stream_parse())
+            written_path = write_trace_store(os.path.join(store_dir, 'from_traces.bin'), traces.values(), self.parser.method_name_by_id)
+            for path in [store_path, written_path]:
+                with TraceStore(path) as store:
+                    self.assertEqual(sorted(store.get_test_names()), sorted(traces.keys()))
+                    self.assertEqual(store.method_name_by_id, self.parser.method_name_by_id)
+                    for test_name in traces:
+                        trace = store.get_trace(test_name)
+                        self.assertEqual(sorted(trace.get_trace()), sorted(traces[test_name].get_trace()))
+                        self.assertEqual(trace.get_edge_counts(), traces[test_name].get_edge_counts())
+                    self.assertRaises(TraceStoreError, store.get_trace, 'no_such_test')
+            self.assertRaises(TraceStoreError, TraceStore, os.path.join(self.traces_dir, 'test_a.xml'))
+            with open(written_path, 'rb') as f:
+                store = f.read()
+
+            def failing_traces():
+                yield traces.values()[0]
+                raise ValueError()
+            self.assertRaises(ValueError, write_trace_store, written_path, failing_traces(), self.parser.method_name_by_id)
+            with open(written_path, 'rb') as f:
+                self.assertEqual(f.read(), store)
+            self.assertEqual(sorted(os.listdir(store_dir)), ['from_traces.bin', 'traces.bin'])
+        finally:
+            shutil.rmtree(store_dir)
+
+    def test_coverage_matrix(self):
+        traces = self.get_traces(self.parser.stream_parse())
+        observations = {'test_a': 0, 'test_b': 1, 'no_trace': 1}
+        matrix = build_coverage_matrix(traces, observations, Granularity.METHODS)
+        self.assertEqual(matrix.shape, (2, 4))
+        for test_ind, test_name in enumerate(matrix.tests):
+            self.assertEqual(sorted(matrix.get_test_components(test_ind)), sorted(traces[test_name].get_trace()))
+            self.assertEqual(matrix.errors[test_ind], observations[test_name])
+        matrix = build_coverage_matrix(traces, observations, Granularity.PACKAGES)
+        self.assertEqual(matrix.components, ['org.example'])
+        self.assertEqual(list(matrix.indptr), [0, 1, 2])
+        tracer_trace = run_mvn.Trace('p.c@t', ['p.Calc@add', 'p.Calc$Inner@sub', 'q.Other@run'])
+        matrix = build_coverage_matrix([tracer_trace], {'p.c@t': 1}, Granularity.FILES)
+        self.assertEqual(sorted(matrix.components), ['p.calc', 'q.other'])
+        matrix = matrix.select_components(['q.other'])
+        self.assertEqual(matrix.get_tests_details(), [('p.c@t', ['q.other'], 1)])
+        self.assertRaises(CoverageMatrixError, CoverageMatrixBuilder, 'lines')
+
+    def test_signature_decode(self):
+        vmsig = '(I[Ljava/util/List;Lorg/example/Calc$Inner;)[[J'
+        signature = Signature.decode(vmsig, True)
+        self.assertIs(Signature.decode(vmsig, True), signature)
+        self.assertIsNot(Signature.decode(vmsig, False), signature)
+        self.assertEqual(signature.args, Signature(vmsig, True).args)
+        self.assertEqual(signature.args, 'int;List[];Inner')
+        self.assertEqual(Signature.decode(vmsig, False).args, 'int;java.util.List[];org.example.Calc.Inner')
+        self.assertEqual(signature.return_value, 'long[][]')
+        self.assertIs(Signature.convert_vm_type('Ljava/lang/String;'), Signature.convert_vm_type('Ljava/lang/String;'))
+
+    def test_lazy_hits(self):
+        traces = self.get_traces(self.parser.stream_parse())
+        lazy_traces = self.get_traces(JcovParser(self.traces_dir, lazy_hits=True).stream_parse())
+        for test_name in traces:
+            lazy_trace = lazy_traces[test_name]
+            self.assertEqual(sorted(lazy_trace.get_trace('files')), sorted(traces[test_name].get_trace('files')))
+            self.assertTrue(all(map(lambda element: element._hits_information is None, lazy_trace.trace.values())))
+            self.assertEqual(sorted(lazy_trace.get_execution_edges()), sorted(traces[test_name].get_execution_edges()))
+            self.assertEqual(sorted(lazy_trace.get_call_graph_edges()), sorted(traces[test_name].get_call_graph_edges()))
+
+
+class Test_build_output(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+
+    def tearDown(self):
+        os.chdir(orig_wd)
+        shutil.rmtree(self.work_dir)
+
+    def echo_cmd(self, lines):
+        script = os.path.join(self.work_dir, 'echo.py')
+        with open(script, 'w') as f:
+            f.write('\n'.join(map(lambda line: 'print({0})'.format(repr(line)), lines)))
+        return '"{0}" "{1}"'.format(sys.executable, script)
+
+    def test_wrap_mvn_cmd_streams_to_consumers(self):
+        lines = ['[INFO] Building sub_mod_1 1.0', '[ERROR] COMPILATION ERROR :', '[INFO] -------------',
+                 '[ERROR] /src/A.java:[1,2] error', '[INFO] -------------------------------------------------------------',
+                 '[INFO] Building sub_mod_2 1.0', '[INFO] BUILD FAILURE']
+        detector = mvn.CompilationErrorDetector()
+        modules = []
+        progress = mvn.ProgressTracker(on_module=modules.append)
+        build_report = mvn.wrap_mvn_cmd(self.echo_cmd(lines), time_limit=60, consumers=[detector, progress])
+        self.assertEqual(build_report.splitlines(), lines)
+        self.assertTrue(detector.has_compilation_error)
+        self.assertEqual(detector.report_lines, lines[1:4])
+        self.assertEqual(modules, ['sub_mod_1 1.0', 'sub_mod_2 1.0'])
+        self.assertEqual(progress.build_result, mvn.ProgressTracker.BUILD_FAILURE)
+        self.assertEqual(os.listdir(mvn.STDOUT_DUPLICATION_DIR), [])
+
+    def test_wrap_mvn_cmd_unfinished_build(self):
+        self.assertEqual(mvn.wrap_mvn_cmd(self.echo_cmd(['[INFO] Building sub_mod_1 1.0']), time_limit=60).splitlines(), ['[INFO] Building sub_mod_1 1.0'])
+
+    def test_timeout_kills_process_tree(self):
+        import time
+        pid_path = os.path.join(self.work_dir, 'pid')
+        script = os.path.join(self.work_dir, 'build.py')
+        with open(script, 'w') as f:
+            f.write('\n'.join(['import subprocess, sys',
+                               'print("[INFO] Building sub_mod_1 1.0")',
+                               'sys.stdout.flush()',
+                               'child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])',
+                               'open({0}, "w").write(str(child.pid))'.format(repr(pid_path)),
+                               'child.wait()']))
+        start = time.time()
+        with self.assertRaises(mvn.MVNTimeoutError) as context:
+            mvn.run_mvn_cmd('"{0}" "{1}"'.format(sys.executable, script), time_limit=2)
+        self.assertLess(time.time() - start, 20)
+        self.assertIn('sub_mod_1', context.exception.report)
+        with open(pid_path) as f:
+            child_pid = int(f.read())
+        time.sleep(0.5)
+        self.assertFalse(self.is_running(child_pid))
+
+    def is_running(self, pid):
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        status_path = '/proc/{0}/status'.format(pid)
+        if os.path.isfile(status_path):
+            with open(status_path) as f:
+                return '(zombie)' not in f.read()
+        return True
+
+    def test_build_result_resources(self):
+        result = mvn.run_mvn_cmd(self.echo_cmd(['[INFO] BUILD SUCCESS']), time_limit=60)
+        self.assertEqual(result.returncode, 0)
+        self.assertFalse(result.timed_out)
+        self.assertFalse(result.stopped)
+        self.assertEqual(result.build_report.splitlines(), ['[INFO] BUILD SUCCESS'])
+        self.assertGreater(result.wall_time, 0)
+        self.assertGreaterEqual(result.cpu_time, 0)
+        try:
+            import psutil
+            self.assertGreater(result.peak_rss, 0)
+        except ImportError:
+            self.assertIsNone(result.peak_rss)
+
+    def test_log_sinks_are_unique(self):
+        sinks = [mvn.LogSink(echo=False), mvn.LogSink(echo=False)]
+        self.assertNotEqual(sinks[0].path, sinks[1].path)
+        for sink in sinks:
+            sink.consume('line\n')
+            sink.close()
+            self.assertEqual(sink.read(), 'line\n')
+            sink.remove()
+
+    def test_fail_fast_kills_build(self):
+        import time
+        with open(os.path.join(self.work_dir, 'A.java'), 'w') as f:
+            f.write('class A {')
+        script = os.path.join(self.work_dir, 'build.py')
+        with open(script, 'w') as f:
+            f.write('\n'.join(['import subprocess, sys, time',
+                               'for line in ["[INFO] Building sub_mod_1 1.0", "[ERROR] COMPILATION ERROR :",',
+                               '             "[INFO] -------------------------------------------------------------",',
+                               '             "[ERROR] A.java:[1,9] reached end of file while parsing", "[INFO] 1 error",',
+                               '             "[INFO] -------------------------------------------------------------"]:',
+                               '    print(line)',
+                               'sys.stdout.flush()',
+                               'subprocess.call([sys.executable, "-c", "import time; time.sleep(30)"])',
+                               'print("[INFO] Building sub_mod_2 1.0")']))
+        repo = Repo.Repo(self.work_dir)
+        start = time.time()
+        build_report = repo.wrap_cached_mvn_cmd('"{0}" "{1}"'.format(sys.executable, script), time_limit=60, fail_fast=True)
+        self.assertLess(time.time() - start, 20)
+        self.assertIn('[INFO] 1 error', build_report)
+        self.assertNotIn('sub_mod_2', build_report)
+        self.assertEqual(map(lambda error: (os.path.basename(error.path), error.line, error.column), repo.compilation_errors), [('A.java', 1, 9)])
+
+
+class Test_reactor(unittest.TestCase):
+    def setUp(self):
+        self.reactor_dir = os.path.join(orig_wd, 'static_files', 'reactor')
+        self.reactor = Reactor(self.reactor_dir)
+
+    def get_artifact_ids(self, modules):
+        return map(lambda module: module.artifact_id, modules)
+
+    def test_modules(self):
+        self.assertEqual(self.get_artifact_ids(self.reactor.modules), ['reactor-root', 'core', 'api', 'app', 'cli'])
+        cli = self.reactor.get_module('cli')
+        self.assertEqual(cli.group_id, 'org.example')
+        self.assertEqual(cli.path, os.path.join(self.reactor_dir, 'tools', 'cli'))
+        self.assertIs(self.reactor.get_module_by_path(os.path.join(self.reactor_dir, 'tools', 'cli')), cli)
+        self.assertEqual(self.get_artifact_ids(self.reactor.get_dependencies(self.reactor.get_module('api'))), ['core', 'reactor-root'])
+        self.assertEqual(self.get_artifact_ids(self.reactor.get_dependents(self.reactor.get_module('core'))), ['api', 'cli'])
+        self.assertRaises(ReactorError, self.reactor.get_module, 'missing')
+        self.assertEqual(self.get_artifact_ids(self.reactor.profile_modules), ['it'])
+        self.assertEqual(self.reactor.get_pom_paths()[-1], os.path.join(self.reactor_dir, 'it', 'pom.xml'))
+
+    def test_build_order(self):
+        order = self.get_artifact_ids(self.reactor.get_build_order())
+        for module in self.reactor.modules:
+            for dependency in self.reactor.get_dependencies(module):
+                self.assertLess(order.index(dependency.artifact_id), order.index(module.artifact_id))
+        self.assertEqual(self.get_artifact_ids(self.reactor.get_build_order([self.reactor.get_module('app'), self.reactor.get_module('core')])), ['app', 'core'])
+
+    def test_run_in_dependency_order(self):
+        import threading
+        import time
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0, 'done': []}
+
+        def run_module(module):
+            with lock:
+                for dependency in self.reactor.get_dependencies(module):
+                    self.assertIn(dependency.artifact_id, state['done'])
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+            time.sleep(0.05)
+            with lock:
+                state['running'] -= 1
+                state['done'].append(module.artifact_id)
+            return module.artifact_id
+
+        results = run_in_dependency_order(self.reactor, run_module, max_workers=2)
+        self.assertEqual(sorted(results.values()), sorted(self.get_artifact_ids(self.reactor.modules)))
+        self.assertEqual(state['max_running'], 2)
+
+    def test_run_in_dependency_order_error(self):
+        def run_module(module):
+            if module.artifact_id == 'core':
+                raise ReactorError('core failed')
+            return module.artifact_id
+        self.assertRaises(ReactorError, run_in_dependency_order, self.reactor, run_module, 4)
+
+    def test_generate_mvn_reactor_module_cmd(self):
+        repo = Repo.Repo(self.reactor_dir)
+        cmd = repo.generate_mvn_reactor_module_cmd(self.reactor.get_module('cli'))
+        self.assertTrue(cmd.startswith('mvn -pl org.example:cli install '))
+        self.assertNotIn('-am', cmd)
+
+    def test_get_all_pom_paths(self):
+        repo = Repo.Repo(self.reactor_dir)
+        self.assertEqual(repo.get_all_pom_paths(), self.reactor.get_pom_paths())
+        self.assertEqual(repo.get_all_pom_paths(os.path.join(self.reactor_dir, 'tools')), [os.path.join(self.reactor_dir, 'tools', 'cli', 'pom.xml')])
+        self.assertEqual(repo.get_all_pom_paths(os.path.join(self.reactor_dir, 'core')), [os.path.join(self.reactor_dir, 'core', 'pom.xml')])
+
+    def test_cached_reactor(self):
+        import time
+        work_dir = tempfile.mkdtemp()
+        try:
+            reactor_dir = os.path.join(work_dir, 'reactor')
+            shutil.copytree(self.reactor_dir, reactor_dir)
+            os.makedirs(os.path.join(reactor_dir, 'target', 'classes'))
+            repo = Repo.Repo(reactor_dir)
+            reactor = repo.get_reactor()
+            self.assertIs(repo.get_reactor(), reactor)
+            pom_path = os.path.join(reactor_dir, 'pom.xml')
+            with open(pom_path) as f:
+                pom = f.read()
+            with open(pom_path, 'w') as f:
+                f.write(pom.replace('<module>app</module>', ''))
+            os.utime(pom_path, (time.time() + 10, time.time() + 10))
+            self.assertTrue(reactor.is_stale())
+            self.assertEqual(self.get_artifact_ids(repo.get_reactor().modules), ['reactor-root', 'core', 'api', 'cli'])
+            missing_dir = os.path.join(reactor_dir, 'missing')
+            os.makedirs(missing_dir)
+            shutil.copy(os.path.join(reactor_dir, 'core', 'pom.xml'), missing_dir)
+            with open(os.path.join(missing_dir, 'pom.xml')) as f:
+                pom = f.read()
+            with open(os.path.join(missing_dir, 'pom.xml'), 'w') as f:
+                f.write(pom.replace('<artifactId>core</artifactId>', '<artifactId>missing</artifactId>'))
+            self.assertIn(os.path.join(missing_dir, 'pom.xml'), repo.get_all_pom_paths())
+        finally:
+            shutil.rmtree(work_dir)
+    def test_overlay(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            reactor_dir = os.path.join(work_dir, 'reactor')
+            shutil.copytree(self.reactor_dir, reactor_dir)
+            poms = {}
+            for pom_path in Reactor(reactor_dir).get_pom_paths():
+                with open(pom_path) as f:
+                    poms[pom_path] = f.read()
+            repo = Repo.Repo(reactor_dir, overlay=True)
+            repo.add_argline_to_surefire('-ea')
+            repo.set_pom_tag('project/properties/skipTests', 'true', module=reactor_dir, create_if_not_exist=True)
+            for pom_path, pom in poms.items():
+                with open(pom_path) as f:
+                    self.assertEqual(f.read(), pom)
+            overlay_root = os.path.join(reactor_dir, 'pom.mvnpy.xml')
+            self.assertEqual(repo.get_mvn_cmd('mvn test -fn -f ' + reactor_dir), 'mvn test -fn -f ' + overlay_root)
+            self.assertEqual(repo.get_mvn_cmd('mvn install -fn'), 'mvn -f {0} install -fn'.format(overlay_root))
+            self.assertEqual(repo.get_pom_tag('project/properties/skipTests', module=reactor_dir).text, 'true')
+            root = ET.parse(overlay_root).getroot()
+            self.assertEqual(map(lambda module: module.text, root.findall('{http://maven.apache.org/POM/4.0.0}modules/{http://maven.apache.org/POM/4.0.0}module')),
+                             ['core/pom.mvnpy.xml', 'api/pom.mvnpy.xml', 'app/pom.mvnpy.xml', 'tools/cli/pom.mvnpy.xml', 'missing'])
+            self.assertEqual(root.find('{http://maven.apache.org/POM/4.0.0}profiles/{http://maven.apache.org/POM/4.0.0}profile/{http://maven.apache.org/POM/4.0.0}modules/{http://maven.apache.org/POM/4.0.0}module').text,
+                             'it/pom.mvnpy.xml')
+            it = ET.parse(os.path.join(reactor_dir, 'it', 'pom.mvnpy.xml')).getroot()
+            self.assertEqual(it.find('{http://maven.apache.org/POM/4.0.0}parent/{http://maven.apache.org/POM/4.0.0}relativePath').text, '../pom.mvnpy.xml')
+            cli = ET.parse(os.path.join(reactor_dir, 'tools', 'cli', 'pom.mvnpy.xml')).getroot()
+            self.assertEqual(cli.find('{http://maven.apache.org/POM/4.0.0}parent/{http://maven.apache.org/POM/4.0.0}relativePath').text, '../../pom.mvnpy.xml')
+            self.assertFalse(repo.get_reactor().is_stale())
+            repo.remove_overlay()
+            self.assertFalse(os.path.exists(overlay_root))
+        finally:
+            shutil.rmtree(work_dir)
+
+    def test_overlay_follows_poms(self):
+        import time
+        work_dir = tempfile.mkdtemp()
+        try:
+            reactor_dir = os.path.join(work_dir, 'reactor')
+            shutil.copytree(self.reactor_dir, reactor_dir)
+            core_dir = os.path.join(reactor_dir, 'core')
+            repo = Repo.Repo(reactor_dir, overlay=True)
+            self.assertEqual(repo.get_pom_tag('project/artifactId', module=core_dir).text, 'core')
+            self.assertFalse(os.path.exists(os.path.join(reactor_dir, 'pom.mvnpy.xml')))
+            self.assertFalse(repo.has_surefire())
+            self.assertFalse(os.path.exists(os.path.join(reactor_dir, 'pom.mvnpy.xml')))
+            repo.set_pom_tag('project/properties/skipTests', 'true', module=reactor_dir, create_if_not_exist=True)
+            repo.set_pom_tag('project/properties/skipTests', 'true', module=core_dir, create_if_not_exist=True)
+            core_pom = os.path.join(core_dir, 'pom.xml')
+            with open(core_pom) as f:
+                pom = f.read()
+            with open(core_pom, 'w') as f:
+                f.write(pom.replace('<artifactId>core</artifactId>', '<artifactId>core</artifactId><name>core</name>'))
+            os.utime(core_pom, (time.time() + 10, time.time() + 10))
+            repo.get_mvn_cmd('mvn install -fn')
+            self.assertIsNone(repo.get_pom_tag('project/properties/skipTests', module=core_dir))
+            self.assertEqual(repo.get_pom_tag('project/name', module=core_dir).text, 'core')
+            self.assertEqual(repo.get_pom_tag('project/properties/skipTests', module=reactor_dir).text, 'true')
+        finally:
+            shutil.rmtree(work_dir)
+
+class Test_sharding(unittest.TestCase):
+    def test_plan_shards(self):
+        costs = {'a': 10.0, 'b': 7.0, 'c': 5.0, 'd': 4.0, 'e': 3.0, 'f': 1.0}
+        shards = plan_shards(['a', 'b', 'c', 'd', 'e', 'f', 'unknown'], costs, 3)
+        self.assertEqual(len(shards), 3)
+        self.assertEqual(sorted(reduce(list.__add__, map(lambda shard: shard.get_mvn_names(), shards))),
+                         ['a', 'b', 'c', 'd', 'e', 'f', 'unknown'])
+        self.assertEqual(sum(map(lambda shard: shard.cost, shards)), sum(costs.values()) + get_default_cost(costs))
+        self.assertLessEqual(max(map(lambda shard: shard.cost, shards)), 4.0 / 3 * sum(map(lambda shard: shard.cost, shards)) / 3)
+        self.assertEqual(len(plan_shards(['a', 'b'], costs, 4)), 2)
+
+    def test_default_cost(self):
+        self.assertEqual(get_default_cost({'a': 1.0, 'b': 9.0, 'c': 3.0}), 3.0)
+        self.assertEqual(get_default_cost({'a': 1.0, 'b': 3.0}), 2.0)
+        self.assertEqual(get_default_cost({}), 1.0)
+
+    def test_costs_from_reports(self):
+        report = TestObjects.TestClassReport(os.path.join(orig_wd, 'static_files', 'TEST-org.apache.tika.cli.TikaCLIBatchCommandLineTest.xml'), '')
+        costs = get_test_classes_costs([report])
+        self.assertEqual(costs, {report.name: report.time})
+
+    def test_generate_mvn_shard_cmd(self):
+        shard = plan_shards(['p.ATest', 'p.BTest'], {}, 1)[0]
+        cmd = Repo.Repo(orig_wd).generate_mvn_shard_cmd(shard)
+        self.assertIn('-Dsurefire.reportNameSuffix=shard0', cmd)
+        self.assertIn('-Dtest=p.ATest,p.BTest', cmd)
+
+
+class Test_build_cache(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.repo_dir = os.path.join(self.work_dir, 'repo')
+        self.cache_dir = os.path.join(self.work_dir, 'cache')
+        os.makedirs(os.path.join(self.repo_dir, 'src', 'main', 'java'))
+        os.makedirs(os.path.join(self.repo_dir, 'target'))
+        self.write('pom.xml', '<project/>')
+        self.write(os.path.join('src', 'main', 'java', 'A.java'), 'class A {}')
+        self.write('notes.txt', 'not a source')
+
+    def tearDown(self):
+        os.chdir(orig_wd)
+        shutil.rmtree(self.work_dir)
+
+    def write(self, relpath, content):
+        with open(os.path.join(self.repo_dir, relpath), 'w') as f:
+            f.write(content)
+
+    def test_fingerprint(self):
+        cache = BuildCache(self.repo_dir, self.cache_dir)
+        fingerprint = cache.get_fingerprint()
+        self.write('notes.txt', 'still not a source')
+        os.makedirs(os.path.join(self.repo_dir, 'target', 'src'))
+        self.assertEqual(BuildCache(self.repo_dir, self.cache_dir).get_fingerprint(), fingerprint)
+        self.write(os.path.join('src', 'main', 'java', 'A.java'), 'class A { }')
+        self.assertNotEqual(cache.get_fingerprint(), fingerprint)
+
+    def test_get_put(self):
+        cache = BuildCache(self.repo_dir, self.cache_dir)
+        self.assertFalse(cache.put('mvn install', '[INFO] BUILD FAILURE', False))
+        self.assertIsNone(cache.get('mvn install'))
+        self.assertTrue(cache.put('mvn install', '[INFO] BUILD SUCCESS', True))
+        self.assertEqual(BuildCache(self.repo_dir, self.cache_dir).get('mvn install'), ('[INFO] BUILD SUCCESS', True))
+        self.assertIsNone(cache.get('mvn test-compile'))
+        self.write('pom.xml', '<project></project>')
+        self.assertIsNone(cache.get('mvn install'))
+        cache.put('mvn install', '[INFO] BUILD SUCCESS', False)
+        shutil.rmtree(os.path.join(self.repo_dir, 'target'))
+        self.assertIsNone(cache.get('mvn install'))
+
+    def test_repo_skips_cached_build(self):
+        os.chdir(self.work_dir)
+        script = os.path.join(self.work_dir, 'build.py')
+        with open(script, 'w') as f:
+            f.write("print('[INFO] BUILD SUCCESS')")
+        cmd = '"{0}" "{1}"'.format(sys.executable, script)
+        repo = Repo.Repo(self.repo_dir, use_build_cache=True, build_cache_dir=self.cache_dir)
+        build_report = repo.wrap_cached_mvn_cmd(cmd)
+        os.remove(script)
+        self.assertEqual(repo.wrap_cached_mvn_cmd(cmd), build_report)
+        self.assertFalse(repo.has_compilation_error())
+        self.assertNotEqual(repo.wrap_cached_mvn_cmd(cmd, use_build_cache=False), build_report)
+
+
+class Test_tests_selection(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        os.chdir(self.work_dir)
+
+    def tearDown(self):
+        os.chdir(orig_wd)
+        shutil.rmtree(self.work_dir)
+
+    def test_surefire_pattern(self):
+        self.assertEqual(mvn.get_surefire_pattern('org.example.CalcTest'), '**/org/example/CalcTest.java')
+        self.assertEqual(mvn.get_surefire_pattern('org.example.CalcTest#testAdd'), '**/org/example/CalcTest.java#testAdd')
+        self.assertEqual(mvn.get_surefire_pattern('**/*IT.java'), '**/*IT.java')
+
+    def test_short_selection_in_cmd(self):
+        self.assertEqual(mvn.get_mvn_tests_selection_args(['a.ATest', 'b.BTest#b']), ' -Dtest=a.ATest,b.BTest#b')
+        self.assertEqual(mvn.get_mvn_tests_selection_args([]), '')
+
+    def test_long_selection_in_files(self):
+        tests_names = map(lambda ind: 'p.Test{0}#test'.format(ind), xrange(5000)) + ['!p.Slow']
+        args = mvn.get_mvn_tests_selection_args(tests_names)
+        self.assertNotIn('-Dtest=', args)
+        includes_file, excludes_file = mvn.get_tests_selection_files(args)
+        with open(includes_file) as f:
+            self.assertEqual(f.read().splitlines(), map(mvn.get_surefire_pattern, tests_names[:-1]))
+        with open(excludes_file) as f:
+            self.assertEqual(f.read().splitlines(), ['**/p/Slow.java'])
+        self.assertEqual(mvn.get_cmd_with_tests_selection(args), mvn.get_cmd_with_tests_selection(mvn.get_mvn_tests_selection_args(tests_names)))
+        mvn.remove_tests_selection_files(args)
+        self.assertFalse(os.path.exists(includes_file) or os.path.exists(excludes_file))
+
+    def test_install_cmd_selection(self):
+        repo = Repo.Repo(self.work_dir)
+        cmd = repo.generate_mvn_install_cmd(testcases=[], tests_to_run=map(lambda ind: 'p.Test{0}'.format(ind), xrange(1000)))
+        self.assertIn('-Dsurefire.includesFile=', cmd)
+        self.assertLess(len(cmd), 1000)
+        self.assertEqual(mvn.get_surefire_version(cmd), mvn.SUREFIRE_VERSION)
+        mvn.remove_tests_selection_files(cmd)
+
+    def test_method_patterns_surefire_version(self):
+        repo = Repo.Repo(self.work_dir)
+        cmd = repo.generate_mvn_rerun_cmd(map(lambda ind: 'p.Test{0}#test'.format(ind), xrange(1000)), 'rerun1')
+        self.assertTrue(mvn.has_method_patterns(cmd))
+        self.assertEqual(mvn.get_surefire_version(cmd), mvn.SUREFIRE_METHOD_PATTERNS_VERSION)
+        self.assertIn('maven-surefire-plugin:{0}:test'.format(mvn.SUREFIRE_METHOD_PATTERNS_VERSION), cmd)
+        mvn.remove_tests_selection_files(cmd)
+        cmd = repo.generate_mvn_rerun_cmd(['p.Test#test'], 'rerun1')
+        self.assertFalse(mvn.has_method_patterns(cmd))
+        self.assertTrue(cmd.startswith('mvn surefire:test '))
+
+
+class Test_reruns(unittest.TestCase):
+    def get_test_result(self, outcome):
+        from junitparser import TestCase, Failure, Error
+        case = TestCase('testAdd')
+        case.classname = 'org.example.CalcTest'
+        if outcome == 'failure':
+            case.result = Failure('failed')
+        elif outcome == 'error':
+            case.result = Error('error')
+        return Repo.TestResult(case)
+
+    def test_flips(self):
+        reruns = Repo.TestReruns(self.get_test_result('failure'))
+        self.assertEqual(reruns.mvn_name, 'org.example.CalcTest#testAdd')
+        reruns.add(self.get_test_result('error'))
+        self.assertFalse(reruns.is_flaky())
+        self.assertFalse(reruns.has_passed())
+        reruns.add(None)
+        reruns.add(self.get_test_result('pass'))
+        reruns.add(self.get_test_result('failure'))
+        self.assertEqual(reruns.outcomes, ['failure', 'error', 'missing', 'pass', 'failure'])
+        self.assertEqual(reruns.reruns, 4)
+        self.assertEqual(reruns.flips, 2)
+        self.assertTrue(reruns.is_flaky())
+
+    def test_suffixed_report_outcomes(self):
+        report_path = os.path.join(orig_wd, 'static_files', 'TEST-org.example.CalcTest-rerun0.xml')
+        outcomes = Repo.Repo(orig_wd).observe_tests([report_path])
+        self.assertEqual(sorted(outcomes.keys()), ['org.example.calctest.testadd', 'org.example.calctest.testsub'])
+        reruns = Repo.TestReruns(self.get_test_result('failure'))
+        reruns.add(outcomes.get(reruns.test.full_name.lower()))
+        self.assertEqual(reruns.outcomes, ['failure', 'pass'])
+        self.assertTrue(reruns.is_flaky())
+        self.assertEqual(outcomes['org.example.calctest.testsub'].outcome, 'failure')
+        report = TestObjects.TestClassReport(report_path, '')
+        self.assertEqual((report.name, report.report_name_suffix), ('org.example.CalcTest', 'rerun0'))
+        self.assertTrue(report.src_path.endswith('example\\CalcTest.java'))
+        self.assertEqual(get_test_classes_costs([report]).keys(), ['org.example.CalcTest'])
+
+    def test_generate_mvn_rerun_cmd(self):
+        cmd = Repo.Repo(orig_wd).generate_mvn_rerun_cmd(['org.example.CalcTest#testAdd'], 'rerun0')
+        self.assertTrue(cmd.startswith('mvn surefire:test '))
+        self.assertIn('-Dsurefire.reportNameSuffix=rerun0', cmd)
+        self.assertIn('-Dtest=org.example.CalcTest#testAdd', cmd)
+
+
+class Test_build_events(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(orig_wd, 'static_files', 'build_reports', 'multi_module_timestamps.txt')) as f:
+            self.build_report = f.read()
+
+    def test_events(self):
+        parser = parse_build_report(self.build_report)
+        kinds = map(lambda event: (event.kind, event.module), parser.events)
+        self.assertEqual(kinds[0], (BuildEvent.MODULE_START, 'core'))
+        self.assertEqual(kinds[-1], (BuildEvent.MODULE_END, 'app'))
+        goals = filter(lambda event: event.kind == BuildEvent.GOAL, parser.events)
+        self.assertEqual(map(lambda event: (event.goal, event.duration), goals),
+                         [('maven-compiler-plugin:3.1:compile', 3.0), ('maven-surefire-plugin:2.18.1:test', 4.0),
+                          ('maven-jar-plugin:2.4:jar', 1.0), ('maven-compiler-plugin:3.1:compile', 2.0)])
+        tests = filter(lambda event: event.kind == BuildEvent.TESTS, parser.events)
+        self.assertEqual(map(lambda event: event.test_class, tests), ['org.example.CalcTest', 'org.example.OtherTest', None])
+
+    def test_breakdown(self):
+        breakdown = parse_build_report(self.build_report).breakdown
+        self.assertEqual(breakdown['core'].duration, 8.5)
+        self.assertEqual(breakdown['app'].duration, 3.0)
+        self.assertEqual(breakdown['core'].tests, {'run': 5, 'failures': 1, 'errors': 1, 'skipped': 1})
+        aggregated = aggregate_breakdowns([breakdown, parse_build_report(self.build_report).breakdown])
+        self.assertEqual(aggregated['core'].runs, 2)
+        self.assertEqual(aggregated['core'].get_average_duration(), 8.5)
+        self.assertEqual(aggregated['app'].goals, {'maven-compiler-plugin:3.1:compile': 4.0})
+
+    def test_arrival_time(self):
+        now = [0.0]
+
+        def clock():
+            now[0] += 1.0
+            return now[0]
+        lines = ['[INFO] Building core 1.0', '[INFO] --- maven-compiler-plugin:3.1:compile (default-compile) @ core ---', '[INFO] BUILD SUCCESS']
+        breakdown = parse_build_report('\n'.join(lines), clock=clock).breakdown
+        self.assertEqual(breakdown['core'].duration, 2.0)
+        self.assertEqual(breakdown['core'].goals, {'maven-compiler-plugin:3.1:compile': 1.0})
+
+
+class Test_benchmarks(unittest.TestCase):
+    def test_measure(self):
+        measures = benchmarks.get_benchmark('compilation_error_report').measure(repeat=3)
+        self.assertEqual(len(measures['times']), 3)
+        self.assertLessEqual(measures['min_time'], measures['time'])
+        self.assertRaises(benchmarks.BenchmarkError, benchmarks.get_benchmark, 'missing')
+
+    def test_compare_results(self):
+        old = {'benchmarks': {'a': {'time': 1.0, 'peak_rss': 100}, 'b': {'time': 1.0, 'peak_rss': 100}, 'c': {'error': 'ImportError'}}}
+        new = {'benchmarks': {'a': {'time': 1.05, 'peak_rss': 200}, 'b': {'time': 2.0, 'peak_rss': 100}, 'c': {'time': 1.0}}}
+        self.assertEqual(benchmarks.compare_results(old, new), [('a', 'peak_rss', 100, 200), ('b', 'time', 1.0, 2.0)])
+
+
+class Test_pom(unittest.TestCase):
+    POM = '\n'.join(['<?xml version="1.0" encoding="UTF-8"?>',
+                     '<project xmlns="http://maven.apache.org/POM/4.0.0">',
+                     '  <dependencies><dependency><artifactId>junit</artifactId></dependency></dependencies>',
+                     '  <build><plugins><plugin><artifactId>maven-surefire-plugin</artifactId></plugin></plugins></build>',
+                     '</project>'])
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.pom_path = os.path.join(self.work_dir, 'pom.xml')
+        with open(self.pom_path, 'w') as f:
+            f.write(Test_pom.POM)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def read_pom(self):
+        with open(self.pom_path) as f:
+            return f.read()
+
+    def test_batch_writes_once(self):
+        writes = []
+        values = [PomValue('maven-surefire-plugin', ['configuration', 'argLine'], '-Xmx1g'),
+                  PomValue('maven-surefire-plugin', ['configuration', 'argLine'], '-ea'),
+                  PomValue('maven-surefire-plugin', ['version'], '3.0.0', should_append=False)]
+        with Pom(self.pom_path, batch=True) as pom:
+            pom.write = lambda: writes.append(Pom.write(pom))
+            for value in values:
+                pom.add_pom_value(value)
+            self.assertEqual(self.read_pom(), Test_pom.POM)
+        self.assertEqual(len(writes), 1)
+        pom = Pom(self.pom_path)
+        surefire = PomPlugin.get_plugin_by_name(pom, PomPlugin.SUREFIRE_ARTIFACT_ID)[0]
+        self.assertEqual(Pom.get_or_create_by_path(surefire, ['configuration', 'argLine']).text, '-Xmx1g -ea')
+        self.assertEqual(Pom.get_or_create_by_path(surefire, ['version']).text, '3.0.0')
+        self.assertEqual(pom.get_elements_by_path(['dependencies', 'dependency', 'version'])[0].text, '4.11')
+        self.assertEqual(os.listdir(self.work_dir), ['pom.xml'])
+
+    def test_batch_skips_unchanged_pom(self):
+        pom = Test_pom.POM.replace('<artifactId>junit</artifactId>', '<artifactId>junit</artifactId><version>4.11</version>')
+        with open(self.pom_path, 'w') as f:
+            f.write(pom)
+        writes = []
+        with Pom(self.pom_path, batch=True) as pom_file:
+            pom_file.write = lambda: writes.append(Pom.write(pom_file))
+            pom_file.set_site_version()
+        self.assertEqual(writes, [])
+        self.assertEqual(self.read_pom(), pom)
+
+    def test_batch_is_discarded_on_error(self):
+        with self.assertRaises(ValueError):
+            with Pom(self.pom_path, batch=True) as pom:
+                pom.add_pom_value(PomValue('maven-surefire-plugin', ['configuration', 'argLine'], '-ea'))
+                raise ValueError()
+        self.assertEqual(self.read_pom(), Test_pom.POM)
+
+    def test_write_pom_keeps_formatting(self):
+        from xml.dom.minidom import parse
+        pom = '\n'.join(['<?xml version="1.0" encoding="ISO-8859-1"?>',
+                         '<!-- licensed to J\xfcrgen -->',
+                         '<project xmlns="http://maven.apache.org/POM/4.0.0">',
+                         '  <name>J\xfcrgen</name>',
+                         '  <build>',
+                         '    <plugins>',
+                         '      <plugin><artifactId>other</artifactId></plugin>',
+                         '      <plugin>',
+                         '        <artifactId>maven-surefire-plugin</artifactId>',
+                         '      </plugin>',
+                         '    </plugins>',
+                         '  </build>',
+                         '</project>', ''])
+        with open(self.pom_path, 'wb') as f:
+            f.write(pom)
+        document = parse(self.pom_path)
+        plugins = document.getElementsByTagName('plugins')[0]
+        mvn.add_plugin_configuration_argline(plugins, 'maven-surefire-plugin', '-ea')
+        mvn.change_plugin_version_if_exists(plugins, 'maven-surefire-plugin', '2.18.1')
+        write_pom(self.pom_path, document)
+        lines = pom.splitlines()
+        self.assertEqual(self.read_pom().splitlines(), lines[:9] + ['        <configuration>', '          <argLine>-ea</argLine>', '        </configuration>',
+                                                                  '        <version>2.18.1</version>'] + lines[9:])
+        self.assertEqual(os.listdir(self.work_dir), ['pom.xml'])
+
+    def test_build_surefire_ver_errors(self):
+        with open(self.pom_path, 'w') as f:
+            f.write(Test_pom.POM.replace('<plugin><artifactId>maven-surefire-plugin</artifactId></plugin>', '<plugin><artifactId/></plugin>'))
+        repo = Repo.Repo(self.work_dir)
+        self.assertRaises(PomEditError, repo.change_surefire_ver)
+        repo.set_build_surefire_ver(mvn.SUREFIRE_VERSION)
+        self.assertEqual(repo.pom_edit_errors.keys(), [os.path.abspath(self.pom_path)])
+
+    def test_pom_keeps_comments(self):
+        pom = '\n'.join(['<?xml version="1.0" encoding="UTF-8"?>',
+                         '<!-- license -->',
+                         '<project xmlns="http://maven.apache.org/POM/4.0.0">',
+                         '  <!-- the build -->',
+                         '  <build>',
+                         '    <plugins>',
+                         '      <!-- tests -->',
+                         '      <plugin>',
+                         '        <artifactId>maven-surefire-plugin</artifactId>',
+                         '      </plugin>',
+                         '    </plugins>',
+                         '  </build>',
+                         '</project>', ''])
+        with open(self.pom_path, 'w') as f:
+            f.write(pom)
+        with Pom(self.pom_path, batch=True) as pom_file:
+            pom_file.add_pom_value(PomValue('maven-surefire-plugin', ['configuration', 'argLine'], '-ea'))
+        lines = pom.splitlines()
+        self.assertEqual(self.read_pom().splitlines(), lines[:9] + ['        <configuration>', '          <argLine>-ea</argLine>',
+                                                                  '        </configuration>'] + lines[9:])
+
+    def test_rewrite_pom(self):
+        import xml.etree.ElementTree as ET
+        root = ET.parse(self.pom_path).getroot()
+        ET.SubElement(ET.SubElement(root, 'properties'), 'skipTests').text = 'true'
+        Repo.Repo(self.work_dir).rewrite_pom(root, self.work_dir)
+        pom = self.read_pom()
+        self.assertTrue(pom.startswith('<?xml version="1.0" encoding="UTF-8"?>\n<project xmlns="http://maven.apache.org/POM/4.0.0">\n'))
+        self.assertIn('\n  <properties>\n    <skipTests>true</skipTests>\n  </properties>\n</project>', pom)
+        self.assertNotIn('ns0:', pom)
+
+    def test_edit_pom_files(self):
+        poms = {'plugins': Test_pom.POM, 'no_build': '<project xmlns="http://maven.apache.org/POM/4.0.0"/>', 'invalid': '<project>'}
+        for name, pom in poms.items():
+            os.makedirs(os.path.join(self.work_dir, name))
+            with open(os.path.join(self.work_dir, name, 'pom.xml'), 'w') as f:
+                f.write(pom)
+        pom_paths = map(lambda name: os.path.join(self.work_dir, name, 'pom.xml'), sorted(poms))
+        results, errors = edit_pom_files(edit_surefire_plugins, pom_paths, (mvn.add_plugin_configuration_argline, '-ea'), workers=2)
+        self.assertEqual(results, dict(zip(pom_paths, [False, False, True])))
+        self.assertEqual(errors, {})
+        with open(pom_paths[2]) as f:
+            self.assertIn('<argLine>-ea</argLine>', f.read())
+        results, errors = edit_pom_files(edit_surefire_plugins, pom_paths, (None,), workers=2)
+        self.assertEqual(errors.keys(), pom_paths[2:])
+        self.assertTrue(errors[pom_paths[2]].startswith('TypeError'))
+        repo = Repo.Repo(os.path.join(self.work_dir, 'plugins'))
+        with self.assertRaises(PomEditError) as context:
+            repo.edit_poms(edit_surefire_plugins, pom_paths, (None,))
+        self.assertEqual(context.exception.errors, errors)
+
+    def test_edit_few_pom_files_serially(self):
+        pom_path = os.path.join(self.work_dir, 'pom.xml')
+        with open(pom_path, 'w') as f:
+            f.write(Test_pom.POM)
+
+        def no_pool(*args):
+            raise AssertionError('a pool was started for a single pom')
+        pool = pom_file.multiprocessing.Pool
+        pom_file.multiprocessing.Pool = no_pool
+        try:
+            results, errors = edit_pom_files(edit_surefire_plugins, [pom_path], (mvn.add_plugin_configuration_argline, '-ea'))
+        finally:
+            pom_file.multiprocessing.Pool = pool
+        self.assertEqual(results, {pom_path: True})
+        self.assertEqual(errors, {})
+
 
 def resetEnvritonment():
     os.system('mvn clean install  -fn -f '+os.getcwd() + r'\static_files\MavenProj')
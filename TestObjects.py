@@ -3,6 +3,16 @@ import xml.etree.ElementTree as ET
 import re
 import javalang
 
+REPORT_NAME_SUFFIX = re.compile(r'^(.*)\(([^()]*)\)$')
+
+
+# Splits a testsuite name (or testcase classname) of a surefire report that was written with -Dsurefire.reportNameSuffix,
+# 'Class(suffix)', to the class name and the suffix. The suffix is None if the name has none
+def split_report_name_suffix(name):
+    match = REPORT_NAME_SUFFIX.match(name or '')
+    if match is None:
+        return name, None
+    return match.group(1), match.group(2)
 
 
 class TestClass(object):
@@ -292,7 +302,7 @@ class TestClassReport(object):
         self._module_path = modlue_path
         tree = ET.parse(self.xml_path)
         root = tree.getroot()
-        self._name = root.get('name')
+        self._name, self.report_name_suffix = split_report_name_suffix(root.get('name'))
         self._src_file_path = self.parse_src_path()
         for testcase in root.findall('testcase'):
             m_test = TestCaseReport(testcase, self)
@@ -347,6 +357,8 @@ class TestClassReport(object):
 
     def parse_src_path(self):
         test_name = os.path.basename(self.xml_path).replace('TEST-', '').replace('.java', '').replace('.xml', '')
+        if self.report_name_suffix and test_name.endswith('-' + self.report_name_suffix):
+            test_name = test_name[:-len('-' + self.report_name_suffix)]
         test_name = test_name.replace('.', '\\')
         test_name += '.java'
         return self.module + '\\src\\test\\java\\' + test_name
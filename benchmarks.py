@@ -0,0 +1,375 @@
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+STATIC_FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static_files')
+TIKA_REPORT = 'TEST-org.apache.tika.cli.TikaCLIBatchCommandLineTest.xml'
+COMPILATION_ERROR_REPORT = 'test_get_compilation_error_testcases_report.txt'
+
+
+class BenchmarkError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return repr(self.msg)
+
+
+class Benchmark(object):
+    """
+    a timed hot path. setup(work_dir) prepares the inputs in an empty temporary dir and returns the arguments of run.
+    run is called repeat times, and only its calls are timed
+    """
+    def __init__(self, name, setup, run, repeat=5):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.repeat = repeat
+
+    # Runs the benchmark in the current process and returns its times (seconds) and peak rss (bytes, None on windows)
+    # after the setup and after the runs
+    def measure(self, repeat=None):
+        work_dir = tempfile.mkdtemp()
+        try:
+            args = self.setup(work_dir)
+            gc.collect()
+            setup_rss = get_peak_rss()
+            times = []
+            for _ in xrange(repeat or self.repeat):
+                start = time.time()
+                self.run(*args)
+                times.append(time.time() - start)
+            return {'times': times, 'time': sorted(times)[len(times) // 2], 'min_time': min(times),
+                    'setup_rss': setup_rss, 'peak_rss': get_peak_rss()}
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def get_peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # kilobytes on linux, bytes on mac
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def write_file(path, content):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def generate_jcov_xml(path, classes, methods):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<coverage xmlns="http://java.sun.com/jcov/namespace">',
+             '<head>', '<property name="coverage.generator.mode" value="METHOD"/>', '</head>', '<package name="org.example">']
+    for class_ind in xrange(classes):
+        lines.append('<class name="Class{0}" supername="java/lang/Object" source="Class{0}.java">'.format(class_ind))
+        for method_ind in xrange(methods):
+            method_id = class_ind * methods + method_ind
+            count = method_id % 3
+            lines.append('<meth name="method{0}" vmsig="(ILjava/lang/String;[J)V" access="1" id="{1}" extra_slots="{2}" count="{3}" HitInformation="{4}"/>'.format(
+                method_ind, method_id, 10 + method_id, count, '[[1,{0},-1]]'.format(10 + method_id) if count else '[]'))
+        lines.append('</class>')
+    lines.extend(['</package>', '</coverage>'])
+    return write_file(path, '\n'.join(lines))
+
+
+def generate_surefire_report(path, test_class, testcases):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<testsuite name="{0}" time="{1}" tests="{2}" errors="0" skipped="0" failures="{3}">'.format(test_class, testcases * 0.01, testcases, testcases // 10),
+             '  <properties>', '    <property name="maven.multiModuleProjectDirectory" value="/repo"/>', '  </properties>']
+    for testcase_ind in xrange(testcases):
+        if testcase_ind % 10:
+            lines.append('  <testcase name="test{0}" classname="{1}" time="0.01"/>'.format(testcase_ind, test_class))
+        else:
+            lines.extend(['  <testcase name="test{0}" classname="{1}" time="0.01">'.format(testcase_ind, test_class),
+                          '    <failure message="expected:&lt;1&gt; but was:&lt;2&gt;" type="java.lang.AssertionError">java.lang.AssertionError</failure>',
+                          '  </testcase>'])
+    lines.append('</testsuite>')
+    return write_file(path, '\n'.join(lines))
+
+
+def setup_jcov_traces(work_dir):
+    return [os.path.join(STATIC_FILES_DIR, 'jcov_traces')]
+
+
+def setup_large_jcov_traces(work_dir):
+    for test_ind in xrange(20):
+        generate_jcov_xml(os.path.join(work_dir, 'Test{0}.xml'.format(test_ind)), 100, 20)
+    return [work_dir]
+
+
+def run_jcov_parse(xml_dir):
+    from jcov_parser import JcovParser
+    return list(JcovParser(xml_dir).parse())
+
+
+def run_jcov_stream_parse(xml_dir):
+    from jcov_parser import JcovParser
+    return list(JcovParser(xml_dir).stream_parse())
+
+
+def setup_test_class_report(work_dir):
+    return [[os.path.join(STATIC_FILES_DIR, TIKA_REPORT)] * 100]
+
+
+def setup_large_test_class_report(work_dir):
+    return [[generate_surefire_report(os.path.join(work_dir, 'TEST-org.example.LargeTest.xml'), 'org.example.LargeTest', 5000)]]
+
+
+def run_test_class_reports(reports):
+    import TestObjects
+    return map(lambda report: TestObjects.TestClassReport(report, ''), reports)
+
+
+def setup_observe_tests(work_dir):
+    return [work_dir, map(lambda test_ind: generate_surefire_report(os.path.join(work_dir, 'target', 'surefire-reports', 'TEST-org.example.Test{0}.xml'.format(test_ind)),
+                                                                     'org.example.Test{0}'.format(test_ind), 100), xrange(100))]
+
+
+def run_observe_tests(repo_dir, surefire_files):
+    import Repo
+    return Repo.Repo(repo_dir).observe_tests(surefire_files)
+
+
+def setup_compilation_error_report(work_dir):
+    with open(os.path.join(STATIC_FILES_DIR, COMPILATION_ERROR_REPORT)) as f:
+        return [f.read()]
+
+
+def setup_large_compilation_error_report(work_dir):
+    report = setup_compilation_error_report(work_dir)[0]
+    module_report = report[:report.index('[INFO] BUILD FAILURE')]
+    return [''.join(map(lambda module_ind: module_report.replace('sub_mod_1', 'sub_mod_{0}'.format(module_ind)), xrange(2000))) + report[report.index('[INFO] BUILD FAILURE'):]]
+
+
+def run_compilation_error_report(build_report):
+    import mvn
+    return mvn.get_compilation_error_report(build_report)
+
+
+def setup_test_classes(work_dir):
+    test_dir = os.path.join(STATIC_FILES_DIR, 'tika_1', 'src', 'test', 'java')
+    test_files = []
+    for root, dirs, names in os.walk(test_dir):
+        test_files.extend(map(lambda name: os.path.join(root, name), filter(lambda name: name.endswith('Test.java'), names)))
+    return [sorted(test_files)]
+
+
+def run_test_classes(test_files):
+    import TestObjects
+    return map(TestObjects.TestClass, test_files)
+
+
+def setup_get_traces(work_dir):
+    debugger_tests_dir = os.path.join(work_dir, 'DebuggerTests')
+    if hasattr(os, 'symlink'):
+        os.symlink(os.path.join(STATIC_FILES_DIR, 'DebuggerTests_commons_math'), debugger_tests_dir)
+    else:
+        shutil.copytree(os.path.join(STATIC_FILES_DIR, 'DebuggerTests_commons_math'), debugger_tests_dir)
+    return [os.path.join(work_dir, 'repo', 'commons-math')]
+
+
+def run_get_traces(repo_dir):
+    import Repo
+    return Repo.Repo(repo_dir).get_traces()
+
+
+def generate_parent_pom(path, lines):
+    pom = ['<?xml version="1.0" encoding="UTF-8"?>',
+           '<!-- generated parent pom, with a non ascii name: J\xc3\xbcrgen -->',
+           '<project xmlns="http://maven.apache.org/POM/4.0.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">',
+           '    <modelVersion>4.0.0</modelVersion>', '    <groupId>org.example</groupId>', '    <artifactId>parent</artifactId>',
+           '    <version>1.0</version>', '    <packaging>pom</packaging>', '    <dependencyManagement>', '        <dependencies>']
+    dependency_ind = 0
+    while len(pom) < lines - 20:
+        pom.extend(['            <dependency>', '                <groupId>org.example.group{0}</groupId>'.format(dependency_ind),
+                    '                <artifactId>artifact{0}</artifactId>'.format(dependency_ind), '                <version>1.{0}</version>'.format(dependency_ind),
+                    '            </dependency>'])
+        dependency_ind += 1
+    pom.extend(['        </dependencies>', '    </dependencyManagement>', '    <build>', '        <plugins>', '            <plugin>',
+                '                <groupId>org.apache.maven.plugins</groupId>', '                <artifactId>maven-surefire-plugin</artifactId>',
+                '                <version>2.17</version>', '            </plugin>', '        </plugins>', '    </build>', '</project>'])
+    return write_file(path, '\n'.join(pom) + '\n')
+
+
+def setup_hit_information(work_dir):
+    # unique strings, most of them of a single [count, previous_slot, parent] triple as in the jcov traces
+    return [map(lambda ind: ','.join(['[[{0},{1},-1]'.format(ind % 7 + 1, ind)] + ['[1,{0},{1}]'.format(ind + 1, ind + 2)] * (ind % 5 == 0)) + ']',
+                xrange(50000))]
+
+
+def setup_cached_hit_information(work_dir):
+    from trace_information import HitInformation
+    hits_information = setup_hit_information(work_dir)[0]
+    map(HitInformation.decode, hits_information)
+    return [hits_information]
+
+
+def run_hit_information_decode_cold(hits_information):
+    from trace_information import HitInformation
+    HitInformation._DECODED.clear()
+    return map(HitInformation.decode, hits_information)
+
+
+def run_hit_information_decode(hits_information):
+    from trace_information import HitInformation
+    return map(HitInformation.decode, hits_information)
+
+
+def run_hit_information_eval(hits_information):
+    return map(eval, hits_information)
+
+
+def setup_large_pom(work_dir):
+    generate_parent_pom(os.path.join(work_dir, 'pom.xml'), 5000)
+    return [work_dir]
+
+
+def setup_large_reactor(work_dir):
+    modules = map(lambda module_ind: 'module{0}'.format(module_ind), xrange(16))
+    generate_parent_pom(os.path.join(work_dir, 'pom.xml'), 1000)
+    with open(os.path.join(work_dir, 'pom.xml')) as f:
+        pom = f.read()
+    write_file(os.path.join(work_dir, 'pom.xml'), pom.replace('    <dependencyManagement>', '    <modules>\n{0}\n    </modules>\n    <dependencyManagement>'.format(
+        '\n'.join(map(lambda module: '        <module>{0}</module>'.format(module), modules))), 1))
+    for module in modules:
+        module_pom = generate_parent_pom(os.path.join(work_dir, module, 'pom.xml'), 2000)
+        with open(module_pom) as f:
+            pom = f.read()
+        write_file(module_pom, pom.replace('<artifactId>parent</artifactId>', '<artifactId>{0}</artifactId>'.format(module), 1))
+    return [work_dir]
+
+
+def run_add_argline_to_surefire_serial(repo_dir):
+    import Repo
+    Repo.Repo(repo_dir).add_argline_to_surefire('-Xmx1g', workers=1)
+
+
+def run_add_argline_to_surefire_parallel(repo_dir):
+    import Repo
+    Repo.Repo(repo_dir).add_argline_to_surefire('-Xmx1g', workers=multiprocessing.cpu_count())
+
+
+def run_change_surefire_ver(repo_dir):
+    import Repo
+    Repo.Repo(repo_dir).change_surefire_ver('2.18.1')
+
+
+def run_add_argline_to_surefire(repo_dir):
+    import Repo
+    Repo.Repo(repo_dir).add_argline_to_surefire('-Xmx1g', workers=multiprocessing.cpu_count())
+
+
+def run_rewrite_pom(repo_dir):
+    import Repo
+    import xml.etree.ElementTree as ET
+    Repo.Repo(repo_dir).rewrite_pom(ET.parse(os.path.join(repo_dir, 'pom.xml')).getroot(), repo_dir)
+
+
+# the bundled jcov traces have different layouts, so only stream_parse can read them
+BENCHMARKS = [Benchmark('jcov_stream_parse', setup_jcov_traces, run_jcov_stream_parse, repeat=20),
+              Benchmark('jcov_parse_large', setup_large_jcov_traces, run_jcov_parse, repeat=3),
+              Benchmark('jcov_stream_parse_large', setup_large_jcov_traces, run_jcov_stream_parse, repeat=3),
+              Benchmark('test_class_report', setup_test_class_report, run_test_class_reports),
+              Benchmark('test_class_report_large', setup_large_test_class_report, run_test_class_reports),
+              Benchmark('observe_tests', setup_observe_tests, run_observe_tests, repeat=3),
+              Benchmark('compilation_error_report', setup_compilation_error_report, run_compilation_error_report, repeat=100),
+              Benchmark('compilation_error_report_large', setup_large_compilation_error_report, run_compilation_error_report),
+              Benchmark('test_class_parsing', setup_test_classes, run_test_classes, repeat=3),
+              Benchmark('get_traces', setup_get_traces, run_get_traces, repeat=3),
+              Benchmark('hit_information_eval', setup_hit_information, run_hit_information_eval, repeat=3),
+              Benchmark('hit_information_decode_cold', setup_hit_information, run_hit_information_decode_cold),
+              Benchmark('hit_information_decode_cached', setup_cached_hit_information, run_hit_information_decode),
+              Benchmark('change_surefire_ver_large_pom', setup_large_pom, run_change_surefire_ver),
+              Benchmark('add_argline_to_surefire_large_pom', setup_large_pom, run_add_argline_to_surefire),
+              Benchmark('rewrite_pom_large_pom', setup_large_pom, run_rewrite_pom),
+              Benchmark('add_argline_to_surefire_reactor_serial', setup_large_reactor, run_add_argline_to_surefire_serial, repeat=3),
+              Benchmark('add_argline_to_surefire_reactor_parallel', setup_large_reactor, run_add_argline_to_surefire_parallel, repeat=3)]
+
+
+def get_benchmark(name):
+    benchmarks = filter(lambda benchmark: benchmark.name == name, BENCHMARKS)
+    if not benchmarks:
+        raise BenchmarkError('unknown benchmark {0}, expected one of {1}'.format(name, map(lambda benchmark: benchmark.name, BENCHMARKS)))
+    return benchmarks[0]
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None, repeat=None):
+    """
+    runs every benchmark (all by default) in its own python process, so its peak rss is not affected by the others.
+    a benchmark that fails is recorded with its error instead of its measures
+    """
+    results = {'revision': get_revision(), 'python': platform.python_version(), 'platform': platform.platform(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'benchmarks': {}}
+    for benchmark in map(get_benchmark, names or map(lambda benchmark: benchmark.name, BENCHMARKS)):
+        cmd = [sys.executable, os.path.abspath(__file__), 'measure', benchmark.name] + ([str(repeat)] if repeat else [])
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)))
+        out, err = proc.communicate()
+        if proc.returncode == 0:
+            results['benchmarks'][benchmark.name] = json.loads(out.splitlines()[-1])
+        else:
+            results['benchmarks'][benchmark.name] = {'error': (err.strip().splitlines() or ['exit code {0}'.format(proc.returncode)])[-1]}
+    return results
+
+
+def write_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def read_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(old_results, new_results, threshold=0.1):
+    """
+    returns (benchmark, measure, old value, new value) of every measure (median time and peak rss) that grew by more than
+    threshold between two results of run_benchmarks
+    """
+    regressions = []
+    for name in sorted(set(old_results['benchmarks']) & set(new_results['benchmarks'])):
+        old, new = old_results['benchmarks'][name], new_results['benchmarks'][name]
+        for measure in ['time', 'peak_rss']:
+            if old.get(measure) and new.get(measure) and new[measure] > old[measure] * (1 + threshold):
+                regressions.append((name, measure, old[measure], new[measure]))
+    return regressions
+
+
+if __name__ == "__main__":
+    usage = "usage: benchmarks.py run <results json> [benchmark ...] | benchmarks.py compare <old results json> <new results json>"
+    assert len(sys.argv) >= 3, usage
+    if sys.argv[1] == 'measure':
+        print(json.dumps(get_benchmark(sys.argv[2]).measure(int(sys.argv[3]) if len(sys.argv) > 3 else None)))
+    elif sys.argv[1] == 'run':
+        results = run_benchmarks(sys.argv[3:])
+        write_results(results, sys.argv[2])
+        for name, measures in sorted(results['benchmarks'].items()):
+            print("{0}: {1}".format(name, measures.get('error') or "{0:.4f}s, {1} bytes".format(measures['time'], measures['peak_rss'])))
+    elif sys.argv[1] == 'compare':
+        assert len(sys.argv) == 4, usage
+        regressions = compare_results(read_results(sys.argv[2]), read_results(sys.argv[3]))
+        for name, measure, old, new in regressions:
+            print("{0} {1}: {2} -> {3} ({4:+.1%})".format(name, measure, old, new, float(new) / old - 1))
+        sys.exit(1 if regressions else 0)
+    else:
+        assert False, usage
@@ -0,0 +1,136 @@
+import functools
+import hashlib
+import json
+import os
+import sys
+
+
+class BuildCache(object):
+    """
+    remembers the build reports of mvn commands by a fingerprint of the poms and the sources (src directories)
+    of a repo, so a command can be skipped if nothing changed since its last successful build.
+    the digest of every file is kept by its size and mtime, so only changed files are read again
+    """
+    SKIPPED_DIRS = set(['target', '.git', '.svn', 'node_modules'])
+    POM_NAME = 'pom.xml'
+    # the copies of the poms in overlay mode (see reactor.OVERLAY_POM_NAME)
+    POM_NAMES = set([POM_NAME, 'pom.mvnpy.xml'])
+    SOURCES_DIR = 'src'
+    TARGET_DIR = 'target'
+    INDEX_NAME = 'index.json'
+    BUILD_SUCCESS = '[INFO] BUILD SUCCESS'
+    HASH_CHUNK_SIZE = 2 ** 20
+
+    def __init__(self, repo_dir, cache_dir=None):
+        self.repo_dir = os.path.abspath(repo_dir)
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.mvnpy', 'build_cache')
+        self.cache_dir = os.path.join(cache_dir, hashlib.md5(self.repo_dir).hexdigest())
+        self._index = self._load_index()
+
+    def get_fingerprint(self):
+        return self._scan()[0]
+
+    def get(self, cmd, fingerprint=None):
+        """
+        returns (build_report, has_compilation_error) of the last successful build of cmd if it was built with
+        the same fingerprint and its target directories still exist, else None
+        """
+        entry = self._index['builds'].get(BuildCache.get_key(cmd))
+        if entry is None:
+            return None
+        if fingerprint is None:
+            fingerprint = self.get_fingerprint()
+        if entry['fingerprint'] != fingerprint:
+            return None
+        if not all(map(lambda target: os.path.isdir(os.path.join(self.repo_dir, target)), entry['targets'])):
+            return None
+        report_path = os.path.join(self.cache_dir, entry['report'])
+        if not os.path.isfile(report_path):
+            return None
+        with open(report_path) as f:
+            return f.read(), entry['has_compilation_error']
+
+    def put(self, cmd, build_report, has_compilation_error):
+        """
+        stores the build report of cmd with the fingerprint of the repo after the build. only successful builds are kept
+        """
+        key = BuildCache.get_key(cmd)
+        if BuildCache.BUILD_SUCCESS not in build_report:
+            self._index['builds'].pop(key, None)
+            self._save_index()
+            return False
+        fingerprint, targets = self._scan()
+        report_name = key + '.txt'
+        BuildCache.write_atomic(os.path.join(self.cache_dir, report_name), build_report)
+        self._index['builds'][key] = {'fingerprint': fingerprint, 'targets': targets, 'report': report_name,
+                                      'has_compilation_error': has_compilation_error}
+        self._save_index()
+        return True
+
+    def invalidate(self):
+        self._index['builds'] = {}
+        self._save_index()
+
+    @staticmethod
+    def get_key(cmd):
+        return hashlib.md5(cmd).hexdigest()
+
+    def _scan(self):
+        fingerprint = hashlib.md5()
+        targets = []
+        files = {}
+        for root, dirs, names in os.walk(self.repo_dir):
+            if BuildCache.POM_NAME in names and BuildCache.TARGET_DIR in dirs:
+                targets.append(self._get_relpath(os.path.join(root, BuildCache.TARGET_DIR)))
+            dirs[:] = sorted(filter(lambda name: name not in BuildCache.SKIPPED_DIRS, dirs))
+            relroot = self._get_relpath(root)
+            in_sources = BuildCache.SOURCES_DIR in relroot.split('/')
+            for name in sorted(names):
+                if not in_sources and name not in BuildCache.POM_NAMES:
+                    continue
+                relpath = '/'.join(filter(None, [relroot, name]))
+                files[relpath] = self._get_file_digest(os.path.join(root, name), relpath)
+                fingerprint.update(relpath + '\0' + files[relpath][2] + '\n')
+        self._index['files'] = files
+        return fingerprint.hexdigest(), sorted(targets)
+
+    def _get_relpath(self, path):
+        relpath = os.path.relpath(path, self.repo_dir).replace(os.path.sep, '/')
+        return '' if relpath == '.' else relpath
+
+    def _get_file_digest(self, path, relpath):
+        stat = os.stat(path)
+        cached = self._index['files'].get(relpath)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+            return cached
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(functools.partial(f.read, BuildCache.HASH_CHUNK_SIZE), b''):
+                md5.update(chunk)
+        return [stat.st_size, stat.st_mtime, md5.hexdigest()]
+
+    def _load_index(self):
+        index_path = os.path.join(self.cache_dir, BuildCache.INDEX_NAME)
+        if os.path.isfile(index_path):
+            try:
+                with open(index_path) as f:
+                    return json.load(f)
+            except ValueError:
+                pass
+        return {'files': {}, 'builds': {}}
+
+    def _save_index(self):
+        BuildCache.write_atomic(os.path.join(self.cache_dir, BuildCache.INDEX_NAME), json.dumps(self._index))
+
+    @staticmethod
+    def write_atomic(path, content):
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        tmp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        if sys.platform == 'win32' and os.path.exists(path):
+            # os.rename does not replace an existing file on windows
+            os.remove(path)
+        os.rename(tmp_path, path)
@@ -0,0 +1,174 @@
+import re
+import time
+
+from mvn import BuildOutputConsumer
+
+
+class BuildEvent(object):
+    MODULE_START = 'module_start'
+    MODULE_END = 'module_end'
+    GOAL = 'goal'
+    TESTS = 'tests'
+
+    def __init__(self, kind, time, module, goal=None, execution_id=None, duration=None, test_class=None, tests=None):
+        self.kind = kind
+        self.time = time
+        self.module = module
+        self.goal = goal
+        self.execution_id = execution_id
+        self.duration = duration
+        self.test_class = test_class
+        self.tests = tests
+
+    def __repr__(self):
+        return "{0}: {1}".format(self.kind, ' '.join(map(str, filter(lambda x: x is not None, [self.module, self.goal, self.test_class, self.duration, self.tests]))))
+
+
+class ModuleBreakdown(object):
+    """
+    time of a module (and of its goals) and its tests counts, summed over the runs that were added to it
+    """
+    TESTS_COUNTS = ['run', 'failures', 'errors', 'skipped']
+
+    def __init__(self, module):
+        self.module = module
+        self.runs = 0
+        self.duration = 0.0
+        self.goals = {}
+        self.tests = dict.fromkeys(ModuleBreakdown.TESTS_COUNTS, 0)
+
+    def add(self, other):
+        self.runs += other.runs
+        self.duration += other.duration
+        for goal, duration in other.goals.items():
+            self.goals[goal] = self.goals.get(goal, 0.0) + duration
+        for count in ModuleBreakdown.TESTS_COUNTS:
+            self.tests[count] += other.tests[count]
+        return self
+
+    def get_average_duration(self):
+        return self.duration / self.runs if self.runs else 0.0
+
+    def __repr__(self):
+        return "{0}: {1:.2f}s in {2} runs".format(self.module, self.duration, self.runs)
+
+
+class BuildEventParser(BuildOutputConsumer):
+    """
+    turns maven output lines into BuildEvents while the build is running (as a consumer of mvn.stream_cmd)
+    or from a finished build report. the time of a line is its timestamp if maven prints one
+    (-Dorg.slf4j.simpleLogger.showDateTime=true), else the time it was consumed
+    """
+    TIMESTAMP = re.compile(r'^(?:\d{4}-\d{2}-\d{2}[ T])?(\d{2}):(\d{2}):(\d{2})(?:[.,](\d{1,3}))?\s+')
+    ARTIFACT = re.compile(r'^\[INFO\] -+< [^:\s]+:(\S+) >-+')
+    MODULE_START = re.compile(r'^\[INFO\] Building (?!\w+:\s)(.+?)(?:\s+\[\d+/\d+\])?\s*$')
+    GOAL = re.compile(r'^\[INFO\] --- (\S+) \((.*?)\) @ (\S+) ---')
+    RUNNING = re.compile(r'^(?:\[INFO\] )?Running (\S+)')
+    TESTS = re.compile(r'Tests run: (\d+), Failures: (\d+), Errors: (\d+), Skipped: (\d+)(, Time elapsed: [\d.,]+ ?s(?:ec)?(?:.*? - in (\S+))?)?')
+    BUILD_END = ['[INFO] Reactor Summary', '[INFO] BUILD SUCCESS', '[INFO] BUILD FAILURE']
+
+    def __init__(self, on_event=None, clock=time.time, keep_events=True):
+        self.on_event = on_event
+        self.clock = clock
+        self.keep_events = keep_events
+        self.events = []
+        self.breakdown = {}
+        self._module = None
+        self._module_start = None
+        self._goal = None
+        self._test_class = None
+        self._artifact_id = None
+
+    # modules are named by their artifactId if maven prints it (3.6 and later), else by their name without the version
+    def consume(self, line):
+        line = line.rstrip('\r\n')
+        now, line = self._get_time(line)
+        match = BuildEventParser.ARTIFACT.match(line)
+        if match:
+            self._artifact_id = match.group(1)
+            return
+        match = BuildEventParser.MODULE_START.match(line)
+        if match:
+            self._end_module(now)
+            self._module = self._artifact_id or match.group(1).rsplit(' ', 1)[0]
+            self._artifact_id = None
+            self._module_start = now
+            self.breakdown.setdefault(self._module, ModuleBreakdown(self._module)).runs += 1
+            self._add_event(BuildEvent(BuildEvent.MODULE_START, now, self._module))
+            return
+        if any(map(lambda end: line.startswith(end), BuildEventParser.BUILD_END)):
+            self._end_module(now)
+            return
+        if self._module is None:
+            return
+        match = BuildEventParser.GOAL.match(line)
+        if match:
+            self._end_goal(now)
+            self._goal = (match.group(1), match.group(2), now)
+            return
+        match = BuildEventParser.RUNNING.match(line)
+        if match:
+            self._test_class = match.group(1)
+            return
+        match = BuildEventParser.TESTS.search(line)
+        if match:
+            tests = dict(zip(ModuleBreakdown.TESTS_COUNTS, map(int, match.groups()[:4])))
+            test_class = None
+            if match.group(5):
+                test_class = match.group(6) or self._test_class
+            else:
+                for count in ModuleBreakdown.TESTS_COUNTS:
+                    self.breakdown[self._module].tests[count] += tests[count]
+            self._add_event(BuildEvent(BuildEvent.TESTS, now, self._module, test_class=test_class, tests=tests))
+
+    def close(self):
+        self._end_module(self.clock())
+
+    def _get_time(self, line):
+        match = BuildEventParser.TIMESTAMP.match(line)
+        if not match:
+            return self.clock(), line
+        hours, minutes, seconds, millis = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int((millis or '0').ljust(3, '0')) / 1000.0, line[match.end():]
+
+    def _end_goal(self, now):
+        if self._goal is None:
+            return
+        goal, execution_id, start = self._goal
+        self._goal = None
+        duration = max(now - start, 0.0)
+        goals = self.breakdown[self._module].goals
+        goals[goal] = goals.get(goal, 0.0) + duration
+        self._add_event(BuildEvent(BuildEvent.GOAL, now, self._module, goal=goal, execution_id=execution_id, duration=duration))
+
+    def _end_module(self, now):
+        if self._module is None:
+            return
+        self._end_goal(now)
+        duration = max(now - self._module_start, 0.0)
+        self.breakdown[self._module].duration += duration
+        self._add_event(BuildEvent(BuildEvent.MODULE_END, now, self._module, duration=duration))
+        self._module = None
+        self._test_class = None
+
+    def _add_event(self, event):
+        if self.keep_events:
+            self.events.append(event)
+        if self.on_event:
+            self.on_event(event)
+
+
+def parse_build_report(build_report, clock=time.time):
+    parser = BuildEventParser(clock=clock)
+    map(parser.consume, build_report.splitlines())
+    parser.close()
+    return parser
+
+
+# Sums the breakdowns (module name -> ModuleBreakdown) of several builds
+def aggregate_breakdowns(breakdowns):
+    aggregated = {}
+    for breakdown in breakdowns:
+        for module, module_breakdown in breakdown.items():
+            aggregated.setdefault(module, ModuleBreakdown(module)).add(module_breakdown)
+    return aggregated
@@ -0,0 +1,153 @@
+from array import array
+
+
+class CoverageMatrixError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return repr(self.msg)
+
+
+class Granularity(object):
+    METHODS = 'methods'
+    CLASSES = 'classes'
+    FILES = 'files'
+    PACKAGES = 'packages'
+    ALL = [METHODS, CLASSES, FILES, PACKAGES]
+
+    # method names are either jcov names (org.example.Calc.add(int;int)) or tracer names (org.example.calc@add)
+    @staticmethod
+    def get_component(method_name, granularity):
+        if granularity == Granularity.METHODS:
+            return method_name
+        class_name = method_name.split("(")[0].split("@")[0]
+        if "@" not in method_name:
+            class_name = ".".join(class_name.split(".")[:-1])
+        if granularity == Granularity.CLASSES:
+            return class_name
+        file_name = class_name.split("$")[0]
+        if granularity == Granularity.FILES:
+            return file_name
+        return ".".join(file_name.split(".")[:-1])
+
+
+class CoverageMatrix(object):
+    """
+    tests x components matrix in CSR form: the components of the i-th test are
+    indices[indptr[i]:indptr[i + 1]] (sorted), errors[i] is 1 if the test failed
+    """
+    INDEX_TYPE = 'i'
+
+    def __init__(self, tests, components, indptr, indices, errors):
+        self.tests = tests
+        self.components = components
+        self.indptr = indptr
+        self.indices = indices
+        self.errors = errors
+
+    @property
+    def shape(self):
+        return len(self.tests), len(self.components)
+
+    def get_row(self, test_ind):
+        return self.indices[self.indptr[test_ind]: self.indptr[test_ind + 1]]
+
+    def get_test_components(self, test_ind):
+        return map(lambda component_ind: self.components[component_ind], self.get_row(test_ind))
+
+    def get_tests_details(self, skip_empty=True):
+        tests_details = []
+        for test_ind, test_name in enumerate(self.tests):
+            if skip_empty and self.indptr[test_ind] == self.indptr[test_ind + 1]:
+                continue
+            tests_details.append((test_name, self.get_test_components(test_ind), self.errors[test_ind]))
+        return tests_details
+
+    def select_components(self, components):
+        """
+        returns a matrix with only the given components (in their current order)
+        """
+        components = set(components)
+        new_ind_by_ind = {}
+        for component_ind, component in enumerate(self.components):
+            if component in components:
+                new_ind_by_ind[component_ind] = len(new_ind_by_ind)
+        indptr = array(CoverageMatrix.INDEX_TYPE, [0])
+        indices = array(CoverageMatrix.INDEX_TYPE)
+        for test_ind in xrange(len(self.tests)):
+            indices.extend(filter(lambda ind: ind is not None, map(new_ind_by_ind.get, self.get_row(test_ind))))
+            indptr.append(len(indices))
+        selected = filter(lambda component: component in components, self.components)
+        return CoverageMatrix(list(self.tests), selected, indptr, indices, array(self.errors.typecode, self.errors))
+
+    def to_scipy(self):
+        from scipy.sparse import csr_matrix
+        data = [1] * len(self.indices)
+        return csr_matrix((data, self.indices, self.indptr), shape=self.shape, dtype='int8')
+
+    def write_planning_file(self, out_path, bugs=None, priors=None):
+        from sfl_diagnoser.Diagnoser.diagnoserUtils import write_planning_file
+        if priors is None:
+            write_planning_file(out_path, bugs or [], self.get_tests_details())
+        else:
+            write_planning_file(out_path, bugs or [], self.get_tests_details(), priors=priors)
+
+
+class CoverageMatrixBuilder(object):
+    """
+    builds a CoverageMatrix from traces (jcov_parser traces or run_mvn.Trace) and tests outcomes.
+    every method name is mapped to its component only once, no matter in how many tests it appears
+    """
+    def __init__(self, granularity=Granularity.FILES):
+        if granularity not in Granularity.ALL:
+            raise CoverageMatrixError('unknown granularity {0}, expected one of {1}'.format(granularity, Granularity.ALL))
+        self.granularity = granularity
+        self.tests = []
+        self.components = []
+        self._component_ind_by_name = {}
+        self._component_ind_by_method = {}
+        self.indptr = array(CoverageMatrix.INDEX_TYPE, [0])
+        self.indices = array(CoverageMatrix.INDEX_TYPE)
+        self.errors = array('b')
+
+    def add(self, test_name, trace, observation):
+        """
+        observation is either 0/1 (1 is failure) or a run_mvn.Test
+        """
+        if hasattr(observation, 'get_observation'):
+            observation = observation.get_observation()
+        self.indices.extend(sorted(set(map(self._get_component_ind, trace.get_trace('methods')))))
+        self.indptr.append(len(self.indices))
+        self.errors.append(int(observation))
+        self.tests.append(test_name)
+        return self
+
+    def add_traces(self, traces, observations):
+        """
+        adds every test that has both a trace and an observation. traces is either a dict by test name or
+        an iterable of traces with a test_name
+        """
+        if isinstance(traces, dict):
+            traces = traces.itervalues()
+        for trace in traces:
+            if trace.test_name in observations:
+                self.add(trace.test_name, trace, observations[trace.test_name])
+        return self
+
+    def build(self):
+        return CoverageMatrix(self.tests, self.components, self.indptr, self.indices, self.errors)
+
+    def _get_component_ind(self, method_name):
+        component_ind = self._component_ind_by_method.get(method_name)
+        if component_ind is None:
+            component = Granularity.get_component(method_name, self.granularity)
+            component_ind = self._component_ind_by_name.setdefault(component, len(self.components))
+            if component_ind == len(self.components):
+                self.components.append(component)
+            self._component_ind_by_method[method_name] = component_ind
+        return component_ind
+
+
+def build_coverage_matrix(traces, observations, granularity=Granularity.FILES):
+    return CoverageMatrixBuilder(granularity).add_traces(traces, observations).build()
@@ -1,9 +1,12 @@
 import functools
+import hashlib
+import marshal
 import os
 import gc
+import multiprocessing
 import xml.etree.cElementTree as et
 
-from trace_information import Signature, TraceElement, Trace
+from trace_information import Signature, TraceElement, Trace, CompactTrace
 
 
 class JcovParser(object):
@@ -11,41 +14,107 @@ class JcovParser(object):
     METH = "<meth"
     METHENTER = "<meth"
     CSV_HEADER = ["component", "hit_count"]
+    CLASS_TAG = "class"
+    CACHE_SUFFIX = ".method_ids"
+    HASH_CHUNK_SIZE = 2 ** 20
 
-    def __init__(self, xml_folder_dir, instrument_only_methods=True, short_type=True):
+    def __init__(self, xml_folder_dir, instrument_only_methods=True, short_type=True, compact=False, cache_dir=None,
+                 template_path=None, lazy_hits=False):
         self.jcov_files = map(lambda name: os.path.join(xml_folder_dir, name),
                               filter(lambda name: name.endswith('.xml'), os.listdir(xml_folder_dir)))
         self.instrument_only_methods = instrument_only_methods
+        self.compact = compact
+        # for coverage only consumers: the hits of every method are decoded only when its edges are asked for
+        self.lazy_hits = lazy_hits
         self.prefixes = set()
         if self.instrument_only_methods:
             self.prefixes.add(JcovParser.METH)
-        self.method_name_by_id = self._get_method_ids(short_type)
-        self.lines_to_read = self._get_methods_lines()
+        self.method_name_by_id = self._load_method_ids(short_type, cache_dir, template_path)
+        self._lines_to_read = None
+
+    @property
+    def lines_to_read(self):
+        if self._lines_to_read is None:
+            self._lines_to_read = self._get_methods_lines()
+        return self._lines_to_read
 
     def parse(self):
         for jcov_file in self.jcov_files:
-            test_name = os.path.splitext(os.path.basename(jcov_file))[0].lower()
-            yield self._parse_jcov_file(jcov_file, test_name)
+            yield self._parse_jcov_file(jcov_file, JcovParser.get_test_name(jcov_file))
+
+    def stream_parse(self):
+        """
+        like parse, but every xml is read exactly once with iterparse, so files with a different layout than the
+        first one are supported and only a single class of the xml is kept in memory
+        """
+        for jcov_file in self.jcov_files:
+            yield self._stream_jcov_file(jcov_file, JcovParser.get_test_name(jcov_file))
+
+    def parallel_parse(self, workers=None, ordered=True):
+        """
+        stream_parse over a process pool of the given number of workers (cpu count by default).
+        the parser, with its method_name_by_id table, is sent to every worker once when it starts
+        (compact traces are sent back without the table).
+        if ordered is False the traces are yielded as soon as they are ready
+        """
+        pool = multiprocessing.Pool(workers, _init_parse_worker, (self,))
+        try:
+            imap = pool.imap if ordered else pool.imap_unordered
+            for trace in imap(_parse_in_worker, self.jcov_files):
+                if self.compact:
+                    trace.method_name_by_id = self.method_name_by_id
+                yield trace
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def get_test_name(jcov_file):
+        return os.path.splitext(os.path.basename(jcov_file))[0].lower()
 
     def _parse_jcov_file(self, jcov_file, test_name):
         gc.collect()
-        trace = self._get_trace_for_file(jcov_file)
+        return self._create_trace(test_name, self._get_jcov_data_by_lines(jcov_file))
+
+    def _stream_jcov_file(self, jcov_file, test_name):
+        return self._create_trace(test_name, self._stream_jcov_data(jcov_file))
+
+    def _create_trace(self, test_name, jcov_data):
+        if self.compact:
+            trace = CompactTrace(test_name, self.method_name_by_id)
+            map(trace.add, jcov_data)
+            return trace
+        trace = {}
+        for data in jcov_data:
+            trace_element = TraceElement(data, self.method_name_by_id, self.lazy_hits)
+            if trace_element.have_count():
+                assert trace_element.id not in trace
+                trace[trace_element.id] = trace_element
         method_name_by_extra_slot = dict(map(lambda e: (e.extra_slot, self.method_name_by_id[e.id]),filter(lambda e: hasattr(e,'extra_slot'),trace.values())))
         method_name_by_extra_slot[-1] = 'None'
         map(lambda element: element.set_previous_method(method_name_by_extra_slot), trace.values())
         return Trace(test_name, trace)
 
-    def _get_trace_for_file(self, jcov_file):
-        trace = {}
+    def _get_jcov_data_by_lines(self, jcov_file):
         for method in self._get_lines_by_inds(jcov_file):
             prefix = filter(lambda prefix: method.startswith(prefix), self.prefixes)[0]
-            data = dict(map(lambda val: val.split('='),
-                            method[len(prefix) + 1:-len(JcovParser.CLOSER)].replace('"', "").split()))
-            trace_element = TraceElement(data, self.method_name_by_id)
-            if trace_element.have_count():
-                assert trace_element.id not in trace
-                trace[trace_element.id] = trace_element
-        return trace
+            yield dict(map(lambda val: val.split('='),
+                           method[len(prefix) + 1:-len(JcovParser.CLOSER)].replace('"', "").split()))
+
+    def _stream_jcov_data(self, jcov_file):
+        tags = set(map(lambda prefix: prefix[1:], self.prefixes))
+        context = et.iterparse(jcov_file, events=('start', 'end'))
+        _, root = next(context)
+        for event, element in context:
+            if event != 'end':
+                continue
+            tag = element.tag.split("}")[-1]
+            if tag in tags and 'count' in element.attrib:
+                yield dict(element.attrib)
+                element.clear()
+            elif tag == JcovParser.CLASS_TAG:
+                element.clear()
+                root.clear()
 
     def _get_lines_by_inds(self, file_path):
         with open(file_path) as f:
@@ -72,30 +141,75 @@ class JcovParser(object):
                                                    JcovParser.get_children_by_name(elem[1], name)), elements), [])
         return elements
 
+    def _load_method_ids(self, short_type, cache_dir=None, template_path=None):
+        """
+        returns method_name_by_id. if cache_dir is given the table (and the block prefixes) is kept there,
+        keyed by the hash of the jcov template (or of the first result file if there is no template)
+        """
+        if cache_dir is None:
+            return self._get_method_ids(short_type)
+        cache_path = os.path.join(cache_dir, self._get_cache_key(template_path or self.jcov_files[0], short_type))
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                method_name_by_id, prefixes = marshal.load(f)
+            self.prefixes.update(prefixes)
+            return method_name_by_id
+        method_name_by_id = self._get_method_ids(short_type)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_path = "{0}.{1}.tmp".format(cache_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            marshal.dump((method_name_by_id, list(self.prefixes)), f)
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            os.remove(tmp_path)
+        return method_name_by_id
+
+    def _get_cache_key(self, jcov_file, short_type):
+        md5 = hashlib.md5()
+        md5.update(repr((marshal.version, self.instrument_only_methods, short_type)))
+        with open(jcov_file, 'rb') as f:
+            for chunk in iter(functools.partial(f.read, JcovParser.HASH_CHUNK_SIZE), b''):
+                md5.update(chunk)
+        return md5.hexdigest() + JcovParser.CACHE_SUFFIX
+
     def _get_method_ids(self, short_type):
-        root = et.parse(self.jcov_files[0]).getroot()
+        """
+        reads the method ids of the first file with a single iterparse pass (the <meth> elements of
+        package/class/meth), clearing every class once it is read, so the file is never fully kept in memory
+        """
         method_ids = {}
-        for method_path, method in JcovParser.get_elements_by_path(root, ['package', 'class', 'meth']):
-            package_name, class_name, method_name = map(lambda elem: elem.attrib['name'], method_path)
-            if method_name == '<init>':
-                method_name = class_name
-            elif method_name == '<clinit>':
-                method_name = class_name + "_" + "init"
-            method_name = ".".join([package_name, class_name, method_name]) + "({0})".format(
-                Signature(method.attrib['vmsig'], short_type).args)
-            id = 0
-            extra_slot = 0
-            if self.instrument_only_methods:
-                id = method.attrib['id']
-                extra_slot = method.attrib['extra_slots']
-                method_ids[int(id)] = method_name
-            else:
-                # id = JcovParser.get_elements_by_path(method, ['bl', 'methenter'])[0][1].attrib['id']
-                # extra_slot = JcovParser.get_elements_by_path(method, ['bl', 'methenter'])[0][1].attrib['extra_slots']
-                method_ids.update(self._get_method_blocks_ids(method, method_name))
-
+        path = []
+        root = None
+        for event, element in et.iterparse(self.jcov_files[0], events=('start', 'end')):
+            if event == 'start':
+                root = root if root is not None else element
+                path.append(element)
+                continue
+            path.pop()
+            tags = map(lambda elem: elem.tag, path[1:]) + [element.tag]
+            if len(tags) == 3 and all(map(lambda (tag, name): tag.endswith(name), zip(tags, ['package', 'class', 'meth']))):
+                method_ids.update(self._get_method_element_ids(path[1:] + [element], short_type))
+                element.clear()
+            elif len(tags) == 2 and tags[1].endswith(JcovParser.CLASS_TAG):
+                element.clear()
+                root.clear()
         return method_ids
 
+    def _get_method_element_ids(self, method_path, short_type):
+        package_name, class_name, method_name = map(lambda elem: elem.attrib['name'], method_path)
+        method = method_path[-1]
+        if method_name == '<init>':
+            method_name = class_name
+        elif method_name == '<clinit>':
+            method_name = class_name + "_" + "init"
+        method_name = ".".join([package_name, class_name, method_name]) + "({0})".format(
+            Signature.decode(method.attrib['vmsig'], short_type).args)
+        if self.instrument_only_methods:
+            return {int(method.attrib['id']): method_name}
+        return self._get_method_blocks_ids(method, method_name)
+
     def _get_method_blocks_ids(self, method_et, method_name):
         ids = {}
         for et in method_et.getchildren():
@@ -109,6 +223,18 @@ class JcovParser(object):
         return ids
 
 
+_worker_parser = None
+
+
+def _init_parse_worker(parser):
+    global _worker_parser
+    _worker_parser = parser
+
+
+def _parse_in_worker(jcov_file):
+    return _worker_parser._stream_jcov_file(jcov_file, JcovParser.get_test_name(jcov_file))
+
+
 def block_to_comps(block):
     splitted = block.split(".")
     package_name = ".".join(splitted[:-3])
@@ -1,6 +1,9 @@
 import os
+import signal
 import subprocess
-from threading import Timer
+import tempfile
+import time
+from threading import Event, Thread, Timer
 from cStringIO import StringIO
 #from bug  import BugError
 import TestObjects
@@ -183,6 +186,96 @@ def get_mvn_exclude_tests_list(tests, time):
             count += 1
     return ans
 
+
+TESTS_SELECTION_DIR = os.path.join('tmp_files', 'tests_selection')
+MAX_TESTS_IN_CMD = 100
+SUREFIRE_VERSION = '2.18.1'
+# surefire reads Class#method patterns from includesFile and excludesFile since 2.19
+SUREFIRE_METHOD_PATTERNS_VERSION = '2.19.1'
+
+
+# Converts a test name (Class or Class#method, '.' separated as in mvn_name) to an includes/excludes file pattern
+def get_surefire_pattern(test_name):
+    if test_name.startswith('%') or '/' in test_name or '*' in test_name:
+        return test_name
+    class_name, _, method = test_name.partition('#')
+    pattern = '**/' + class_name.replace('.', '/') + '.java'
+    if method:
+        pattern += '#' + method
+    return pattern
+
+
+# Writes the patterns of the tests to a new file and returns its path
+def write_tests_selection_file(tests_names, selection_dir=TESTS_SELECTION_DIR):
+    if not os.path.isdir(selection_dir):
+        os.makedirs(selection_dir)
+    fd, path = tempfile.mkstemp(prefix='tests_', suffix='.txt', dir=selection_dir)
+    with os.fdopen(fd, 'w') as f:
+        f.writelines(map(lambda test_name: get_surefire_pattern(test_name) + '\n', tests_names))
+    return os.path.abspath(path)
+
+
+# Returns the surefire arguments that select tests_names ('!' prefixed names are excluded).
+# Up to max_tests_in_cmd tests are selected by -Dtest, more tests by includesFile/excludesFile, with no limit on their number
+def get_mvn_tests_selection_args(tests_names, max_tests_in_cmd=MAX_TESTS_IN_CMD):
+    if not tests_names:
+        return ''
+    if len(tests_names) <= max_tests_in_cmd:
+        return ' -Dtest=' + ','.join(tests_names)
+    excluded = map(lambda test_name: test_name[1:], filter(lambda test_name: test_name.startswith('!'), tests_names))
+    included = filter(lambda test_name: not test_name.startswith('!'), tests_names)
+    ans = ''
+    if included:
+        ans += ' -Dsurefire.includesFile="{0}"'.format(write_tests_selection_file(included))
+    if excluded:
+        ans += ' -Dsurefire.excludesFile="{0}"'.format(write_tests_selection_file(excluded))
+    return ans
+
+
+TESTS_SELECTION_ARGS = ['-Dsurefire.includesFile="', '-Dsurefire.excludesFile="']
+
+
+def get_tests_selection_files(cmd):
+    return map(lambda arg: cmd.split(arg)[1].split('"')[0], filter(lambda arg: arg in cmd, TESTS_SELECTION_ARGS))
+
+
+# Returns whether the selection files of the given mvn command (or tests selection args) have Class#method patterns
+def has_method_patterns(cmd):
+    for path in filter(os.path.isfile, get_tests_selection_files(cmd)):
+        with open(path) as f:
+            if filter(lambda line: '#' in line, f):
+                return True
+    return False
+
+
+# Returns the surefire version to set in the poms for cmd: version, unless the selection files of cmd have
+# Class#method patterns, that surefire ignores before SUREFIRE_METHOD_PATTERNS_VERSION
+def get_surefire_version(cmd, version=SUREFIRE_VERSION):
+    if has_method_patterns(cmd):
+        return SUREFIRE_METHOD_PATTERNS_VERSION
+    return version
+
+
+# Returns the goal that runs the surefire tests of the given tests selection args, without changing the poms:
+# surefire:test, or the surefire version that reads Class#method patterns if the selection files have them
+def get_surefire_test_goal(tests_selection_args):
+    if has_method_patterns(tests_selection_args):
+        return 'org.apache.maven.plugins:maven-surefire-plugin:{0}:test'.format(SUREFIRE_METHOD_PATTERNS_VERSION)
+    return 'surefire:test'
+
+
+# Returns cmd with the content of its selection files instead of their (unique) paths
+def get_cmd_with_tests_selection(cmd):
+    for path in filter(os.path.isfile, get_tests_selection_files(cmd)):
+        with open(path) as f:
+            cmd = cmd.replace(path, ','.join(f.read().splitlines()))
+    return cmd
+
+
+# Removes the selection files of the given mvn command
+def remove_tests_selection_files(cmd):
+    map(os.remove, filter(os.path.isfile, get_tests_selection_files(cmd)))
+
 # changes the plugin version of 'plugin_artifact_id' to 'version'. Does nothing if the 'plugin_artifact_id' is not in plugins_tag
 def change_plugin_version_if_exists(plugins_tag, plugin_artifact_id, version):
     plugin_p = None
@@ -266,28 +359,266 @@ def parse_tests(tests_dir):
     return ans
 
 
-def wrap_mvn_cmd(cmd, time_limit = sys.maxint, dir=None, env=None):
-    output_tmp_files_dir = os.path.join('tmp_files','stdout_duplication')
-    if not os.path.isdir(output_tmp_files_dir):
-        os.makedirs(output_tmp_files_dir)
-    tmp_file_path = os.path.join(output_tmp_files_dir,'tmp_file.txt')
-    with open(tmp_file_path, 'w+') as tmp_f:
-        my_env = os.environ.copy()
-        if env:
-            my_env.update(env)
-        proc = subprocess.Popen(cmd, shell=True,stdout=tmp_f, cwd=dir, env=my_env)
-        t = Timer(time_limit, kill, args=[proc])
-        t.start()
+STDOUT_DUPLICATION_DIR = os.path.join('tmp_files', 'stdout_duplication')
+
+
+# Consumes the build output line by line while the build is running
+class BuildOutputConsumer(object):
+    def consume(self, line):
+        pass
+
+    # Returns true if the build should be aborted
+    def should_stop(self):
+        return False
+
+    def close(self):
+        pass
+
+
+# Writes the build output to a log file of its own (and to stdout if echo)
+class LogSink(BuildOutputConsumer):
+    def __init__(self, log_dir=STDOUT_DUPLICATION_DIR, echo=True):
+        if not os.path.isdir(log_dir):
+            os.makedirs(log_dir)
+        fd, self.path = tempfile.mkstemp(prefix='mvn_', suffix='.txt', dir=log_dir)
+        self._file = os.fdopen(fd, 'w')
+        self.echo = echo
+
+    def consume(self, line):
+        self._file.write(line)
+        if self.echo:
+            sys.stdout.write(line)
+
+    def close(self):
+        self._file.close()
+
+    def read(self):
+        with open(self.path, 'r') as f:
+            return f.read()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# Detects compilation errors in the build output, like get_compilation_error_report.
+# keeps at most MAX_LINES lines of the compilation errors report. if fail_fast, asks to stop the build after the first report
+class CompilationErrorDetector(BuildOutputConsumer):
+    MAX_LINES = 1000
+
+    def __init__(self, fail_fast=False):
+        self.fail_fast = fail_fast
+        self.has_compilation_error = False
+        self.report_lines = []
+        self._in_report = False
+        self._skip_end_check = False
+
+    def consume(self, line):
+        line = line.rstrip('\r\n')
+        if is_start_of_compilation_error_report(line) or line.endswith('Compilation failure'):
+            self.has_compilation_error = True
+            self._in_report = True
+            self._skip_end_check = '[ERROR] COMPILATION ERROR :' in line
+        elif self._skip_end_check:
+            self._skip_end_check = False
+        elif self._in_report and end_of_compilation_errors(line):
+            self._in_report = False
+        if self._in_report and len(self.report_lines) < CompilationErrorDetector.MAX_LINES:
+            self.report_lines.append(line)
+
+    def should_stop(self):
+        return self.fail_fast and self.has_compilation_error and not self._in_report
+
+    def get_compilation_errors(self):
+        return get_compilation_errors(self.report_lines)
+
+
+# Tracks the modules being built and the build result
+class ProgressTracker(BuildOutputConsumer):
+    BUILDING = '[INFO] Building '
+    BUILD_SUCCESS = '[INFO] BUILD SUCCESS'
+    BUILD_FAILURE = '[INFO] BUILD FAILURE'
+
+    def __init__(self, on_module=None):
+        self.on_module = on_module
+        self.lines_count = 0
+        self.modules_count = 0
+        self.current_module = None
+        self.build_result = None
+
+    def consume(self, line):
+        self.lines_count += 1
+        if line.startswith(ProgressTracker.BUILDING) and not line.startswith(ProgressTracker.BUILDING + 'jar:'):
+            self.current_module = line[len(ProgressTracker.BUILDING):].strip()
+            self.modules_count += 1
+            if self.on_module:
+                self.on_module(self.current_module)
+        elif ProgressTracker.BUILD_SUCCESS in line:
+            self.build_result = ProgressTracker.BUILD_SUCCESS
+        elif ProgressTracker.BUILD_FAILURE in line:
+            self.build_result = ProgressTracker.BUILD_FAILURE
+
+    def is_finished(self):
+        return self.build_result is not None
+
+
+# Returns the Popen arguments that start the process in a new process group, so it can be killed with its children
+def get_process_group_kwargs():
+    if sys.platform == 'win32':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'preexec_fn': os.setsid}
+
+
+# Kills the process with all its children (the forked surefire jvms)
+def kill_tree(proc):
+    if sys.platform == 'win32':
+        with open(os.devnull, 'w') as devnull:
+            subprocess.call('taskkill /F /T /PID {0}'.format(proc.pid), stdout=devnull, stderr=devnull)
+    else:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+class BuildResult(object):
+    """
+    the outcome of a build: exit code, whether it was killed on timeout or stopped by a consumer, and the
+    resources of its process tree (see ResourceMonitor). cpu_time (seconds) and peak_rss (bytes) are None if they
+    can not be measured: peak_rss is measured only with psutil
+    """
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.returncode = None
+        self.timed_out = False
+        self.stopped = False
+        self.wall_time = 0.0
+        self.cpu_time = None
+        self.peak_rss = None
+        self.build_report = None
+
+    def __repr__(self):
+        return "returncode={0} timed_out={1} wall_time={2:.2f}s cpu_time={3} peak_rss={4}".format(
+            self.returncode, self.timed_out, self.wall_time, self.cpu_time, self.peak_rss)
+
+
+class ResourceMonitor(object):
+    """
+    measures the cpu time and peak rss of a process tree. with psutil the tree is sampled every SAMPLE_INTERVAL
+    seconds (peak_rss is the peak of the sum of the tree). without it, on posix, only cpu_time is measured, from the
+    usage of the waited children of this process, so it is not exact if builds run in parallel. peak_rss is None then:
+    the maxrss of the children is the largest process ever waited on by this process, not of this build
+    """
+    SAMPLE_INTERVAL = 0.5
+
+    def __init__(self, proc):
+        self.proc = proc
+        self.cpu_time = None
+        self.peak_rss = None
+        self._stop = Event()
+        self._thread = None
+        self._rusage = None
+        try:
+            import psutil
+            self._psutil = psutil
+            self._thread = Thread(target=self._sample)
+            self._thread.daemon = True
+            self._thread.start()
+        except ImportError:
+            self._psutil = None
+            if sys.platform != 'win32':
+                import resource
+                self._rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def _sample(self):
+        try:
+            root = self._psutil.Process(self.proc.pid)
+        except self._psutil.Error:
+            return
+        cpu_times = {}
+        while not self._stop.is_set():
+            try:
+                processes = [root] + root.children(recursive=True)
+            except self._psutil.Error:
+                break
+            rss = 0
+            for process in processes:
+                try:
+                    times = process.cpu_times()
+                    cpu_times[process.pid] = times.user + times.system
+                    rss += process.memory_info().rss
+                except self._psutil.Error:
+                    pass
+            self.cpu_time = sum(cpu_times.values())
+            self.peak_rss = max(self.peak_rss or 0, rss)
+            self._stop.wait(ResourceMonitor.SAMPLE_INTERVAL)
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        elif self._rusage is not None:
+            import resource
+            rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            self.cpu_time = rusage.ru_utime + rusage.ru_stime - self._rusage.ru_utime - self._rusage.ru_stime
+
+
+def timeout_kill(proc, result):
+    result.timed_out = True
+    kill_tree(proc)
+
+
+# Runs cmd in its own process group and passes every line of its stdout to the consumers as soon as it is written.
+# the process tree is killed if time_limit passes or if a consumer asks to stop. returns a BuildResult
+def stream_cmd(cmd, consumers, time_limit=sys.maxint, dir=None, env=None):
+    my_env = os.environ.copy()
+    if env:
+        my_env.update(env)
+    result = BuildResult(cmd)
+    start = time.time()
+    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, cwd=dir, env=my_env, **get_process_group_kwargs())
+    monitor = ResourceMonitor(proc)
+    t = Timer(time_limit, timeout_kill, args=[proc, result])
+    t.start()
+    try:
+        for line in iter(proc.stdout.readline, ''):
+            for consumer in consumers:
+                consumer.consume(line)
+            if any(map(lambda consumer: consumer.should_stop(), consumers)):
+                result.stopped = True
+                kill_tree(proc)
+                break
         proc.wait()
+    finally:
         t.cancel()
-    with open(tmp_file_path, "r") as tmp_f:
-        build_report = tmp_f.read()
-        print(build_report)
-    if not time_limit == sys.maxint and not ('[INFO] BUILD SUCCESS' in build_report or '[INFO] BUILD FAILURE' in build_report):
-        raise MVNTimeoutError('Build took too long', build_report)
-    #if has_compilation_error(build_report):
-    #    raise MVNTimeoutError('Build report has compilation error', build_report)
-    return build_report.replace('\\n','\n')
+        proc.stdout.close()
+        monitor.stop()
+        for consumer in consumers:
+            consumer.close()
+    result.returncode = proc.returncode
+    result.wall_time = time.time() - start
+    result.cpu_time = monitor.cpu_time
+    result.peak_rss = monitor.peak_rss
+    return result
+
+
+# Executes cmd and returns its BuildResult, with the build report. the output is also passed to consumers while the
+# build is running. raises MVNTimeoutError if the build was killed on time_limit
+def run_mvn_cmd(cmd, time_limit=sys.maxint, dir=None, env=None, consumers=[]):
+    log_sink = LogSink()
+    try:
+        result = stream_cmd(cmd, [log_sink] + list(consumers), time_limit=time_limit, dir=dir, env=env)
+        result.build_report = log_sink.read().replace('\\n','\n')
+    finally:
+        log_sink.remove()
+    if result.timed_out:
+        raise MVNTimeoutError('Build took too long', result.build_report)
+    return result
+
+
+# Executes cmd and returns its build report. the output is also passed to consumers while the build is running
+def wrap_mvn_cmd(cmd, time_limit = sys.maxint, dir=None, env=None, consumers=[]):
+    return run_mvn_cmd(cmd, time_limit=time_limit, dir=dir, env=env, consumers=consumers).build_report
 
 def wrap_mvn_cmd_1(cmd, time_limit = sys.maxint):
     proc = subprocess.Popen(cmd, shell=True, stdout= subprocess.PIPE)
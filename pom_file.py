@@ -1,7 +1,127 @@
-import xml.etree.cElementTree as et
+import codecs
+import multiprocessing
+import os
+import re
+import sys
+from xml.dom import Node
+from xml.dom.minidom import parse, parseString
+from xml.parsers.expat import ExpatError
+import xml.etree.ElementTree
+import xml.etree.ElementTree as et
 et.register_namespace('', "http://maven.apache.org/POM/4.0.0")
 et.register_namespace('xsi', "http://www.w3.org/2001/XMLSchema-instance")
 
+PROLOG_PART = re.compile(r'\s*(?:<\?.*?\?>|<!--.*?-->|<!DOCTYPE[^>]*>)', re.DOTALL)
+ENCODING = re.compile(r'^<\?xml[^>]*encoding=["\']([^"\']+)["\']')
+DEFAULT_INDENT = '    '
+# below this many poms per cpu edit_pom_files edits the poms serially, since starting a pool costs more than the edits
+POOL_MIN_POMS_PER_CPU = 2
+
+
+# Returns the text of a pom before its root element (the xml declaration, comments) and its encoding
+def get_pom_prolog(pom_text):
+    end = len(codecs.BOM_UTF8) if pom_text.startswith(codecs.BOM_UTF8) else 0
+    match = PROLOG_PART.match(pom_text, end)
+    while match:
+        end = match.end()
+        match = PROLOG_PART.match(pom_text, end)
+    prolog = pom_text[:end] + re.match(r'\s*', pom_text[end:]).group(0)
+    encoding = ENCODING.search(prolog.lstrip(codecs.BOM_UTF8).lstrip())
+    return prolog, encoding.group(1) if encoding else 'utf-8'
+
+
+def get_indent(text):
+    return text[text.rfind('\n') + 1:]
+
+
+def is_indentation(node):
+    return node is not None and node.nodeType == Node.TEXT_NODE and '\n' in node.data and not node.data.strip()
+
+
+def indent_new_elements(element, indent='', step=None, force=False):
+    """
+    adds line breaks and indentation before the elements that were added to a parsed minidom element,
+    as deep as their indented siblings. elements that were written in a single line are kept as they are
+    """
+    children = filter(lambda child: child.nodeType == Node.ELEMENT_NODE, element.childNodes)
+    if not children:
+        return
+    if not force and not filter(is_indentation, element.childNodes):
+        map(lambda child: indent_new_elements(child, indent, step), children)
+        return
+    indents = filter(lambda child_indent: len(child_indent) > len(indent),
+                     map(lambda child: get_indent(child.previousSibling.data), filter(lambda child: is_indentation(child.previousSibling), children)))
+    if indents:
+        child_indent = indents[0]
+    else:
+        child_indent = indent + (step or DEFAULT_INDENT)
+    if not step and child_indent.startswith(indent) and len(child_indent) > len(indent):
+        step = child_indent[len(indent):]
+    document = element.ownerDocument
+    for child in children:
+        added = not is_indentation(child.previousSibling)
+        if added:
+            element.insertBefore(document.createTextNode('\n' + child_indent), child)
+        elif get_indent(child.previousSibling.data) == indent != child_indent:
+            # appended after the indentation of the closing tag
+            added = True
+            child.previousSibling.data += child_indent[len(indent):]
+        indent_new_elements(child, child_indent, step, added)
+    if element.lastChild.nodeType == Node.ELEMENT_NODE:
+        element.appendChild(document.createTextNode('\n' + indent))
+
+
+def serialize_pom(root, pom_text=''):
+    """
+    serializes root (a minidom document or element, or an ElementTree element) as the pom whose current content is
+    pom_text: its xml declaration, comments before the root and trailing whitespace are kept as they are,
+    the rest is written in the encoding of the pom, and added elements are indented like their siblings
+    """
+    if hasattr(root, 'documentElement'):
+        root = root.documentElement
+    elif not hasattr(root, 'nodeType'):
+        root = parseString(xml.etree.ElementTree.tostring(root, 'utf-8')).documentElement
+    prolog, encoding = get_pom_prolog(pom_text)
+    if not prolog:
+        prolog = '<?xml version="1.0" encoding="{0}"?>\n'.format(encoding.upper())
+    indent_new_elements(root)
+    trailer = pom_text[len(pom_text.rstrip()):] or '\n'
+    return prolog + root.toxml().encode(encoding, 'xmlcharrefreplace') + trailer
+
+
+# Writes root (see serialize_pom) to pom_path atomically. The declaration and encoding are taken from source_path
+# (pom_path by default)
+def write_pom(pom_path, root, source_path=None):
+    source_path = source_path or pom_path
+    pom_text = ''
+    if os.path.isfile(source_path):
+        with open(source_path, 'rb') as f:
+            pom_text = f.read()
+    tmp_path = "{0}.{1}.tmp".format(pom_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(serialize_pom(root, pom_text))
+    if sys.platform == 'win32' and os.path.exists(pom_path):
+        # os.rename does not replace an existing file on windows
+        os.remove(pom_path)
+    os.rename(tmp_path, pom_path)
+
+
+class CommentedTreeBuilder(et.TreeBuilder):
+    """
+    a TreeBuilder that keeps the comments inside the root element as et.Comment elements, so they are written back
+    by serialize_pom. the comments around the root are kept by serialize_pom from the text of the pom
+    """
+    def comment(self, data):
+        if self._elem:
+            self.start(et.Comment, {})
+            self.data(data)
+            self.end(et.Comment)
+
+
+# Parses a pom as an ElementTree, keeping its comments
+def parse_pom(pom_path):
+    return et.parse(pom_path, et.XMLParser(target=CommentedTreeBuilder()))
+
 
 def is_surefire_plugin(plugin):
     return filter(lambda x: x.text == PomPlugin.SUREFIRE_ARTIFACT_ID, Pom.get_children_by_name(plugin, PomPlugin.ARTIFACT_ID_NAME))
@@ -70,14 +190,33 @@ class PomValue(object):
 
 
 class Pom(object):
-    def __init__(self, pom_path):
+    """
+    a pom.xml that is saved after every edit (opening it sets the version of its junit dependencies to 4.11).
+    in batch mode the edits are only applied in memory, and the pom is written once (atomically) by commit,
+    or when its with block ends without an exception, if any edit has changed it:
+
+        with Pom(pom_path, batch=True) as pom:
+            for value in values:
+                pom.add_pom_value(value)
+    """
+    def __init__(self, pom_path, batch=False):
         self.pom_path = pom_path
-        self.element_tree = et.parse(self.pom_path)
+        self.batch = batch
+        self._modified = False
+        self.element_tree = parse_pom(self.pom_path)
         self.set_junit_version()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        return False
+
     @staticmethod
     def get_children_by_name(element, name):
-        return filter(lambda e: e.tag.endswith(name), element.getchildren())
+        return filter(lambda e: e.tag is not et.Comment and e.tag.endswith(name), element.getchildren())
 
     @staticmethod
     def get_or_create_child(element, name):
@@ -143,21 +282,126 @@ class Pom(object):
         self.save()
 
     def set_junit_version(self, version='4.11'):
-        junit_dependencies = filter(is_junit_plugin, self.get_elements_by_path(['dependencies', 'dependency']))
-        for dependency in junit_dependencies:
-            created_element = Pom.get_or_create_by_path(dependency, ['version'])
-            created_element.text = version
-        self.save()
+        self.set_version(filter(is_junit_plugin, self.get_elements_by_path(['dependencies', 'dependency'])), version)
 
     def set_site_version(self, version='3.3'):
-        dependencies = filter(is_maven_site_plugin, self.get_elements_by_path(['build', 'pluginManagement', 'plugins', 'plugin']))
+        self.set_version(filter(is_maven_site_plugin, self.get_elements_by_path(['build', 'pluginManagement', 'plugins', 'plugin'])), version)
+
+    # Sets the version of the given dependencies (or plugins), and saves the pom only if one of them has changed
+    def set_version(self, dependencies, version):
+        changed = False
         for dependency in dependencies:
             created_element = Pom.get_or_create_by_path(dependency, ['version'])
-            created_element.text = version
-        self.save()
+            if created_element.text != version:
+                created_element.text = version
+                changed = True
+        if changed:
+            self.save()
 
     def save(self):
-        self.element_tree.write(self.pom_path, xml_declaration=True)
+        if self.batch:
+            self._modified = True
+        else:
+            self.write()
+
+    # Writes the pom if it was edited since the last commit
+    def commit(self):
+        if self._modified:
+            self.write()
+            self._modified = False
+
+    def write(self):
+        write_pom(self.pom_path, self.element_tree.getroot())
 
     def has_surefire(self):
         return len(PomPlugin.get_plugin_by_name(self, PomPlugin.SUREFIRE_ARTIFACT_ID)) > 0
+
+
+class PomEditError(Exception):
+    def __init__(self, msg, errors=None):
+        self.msg = msg
+        self.errors = errors or {}
+
+    def __str__(self):
+        return repr(self.msg)
+
+
+def add_pom_values(pom_path, values, create_plugin_if_not_exists=False, set_site_version=False):
+    with Pom(pom_path, batch=True) as pom:
+        if set_site_version:
+            pom.set_site_version()
+        for value in values:
+            pom.add_pom_value(value, create_plugin_if_not_exists=create_plugin_if_not_exists)
+    return True
+
+
+def edit_surefire_plugins(pom_path, edit, *args):
+    """
+    adds maven-surefire-plugin to the <build><plugins> of the pom if it is missing, and calls
+    edit(plugins, 'maven-surefire-plugin', *args) on every <plugins> of the build (see mvn.add_plugin_configuration_argline).
+    returns False if the pom is not valid or has no build plugins
+    """
+    try:
+        document = parse(pom_path)
+    except ExpatError:
+        # assume that file is not valid pom
+        return False
+    build_list = filter(lambda b: b.parentNode is not None and b.parentNode.localName == 'project', document.getElementsByTagName('build'))
+    if len(build_list) == 0:
+        return False
+    assert len(build_list) == 1
+    plugins_tags = build_list[0].getElementsByTagName('plugins')
+    if len(plugins_tags) == 0:
+        return False
+    for plugins_tag in plugins_tags:
+        if plugins_tag.parentNode.localName == 'build':
+            artifacts_ids = map(lambda a: str(a.firstChild.data), plugins_tag.getElementsByTagName('artifactId'))
+            if PomPlugin.SUREFIRE_ARTIFACT_ID not in artifacts_ids:
+                new_plugin = plugins_tag.appendChild(document.createElement('plugin'))
+                new_plugin.appendChild(document.createElement('groupId')).appendChild(document.createTextNode('org.apache.maven.plugins'))
+                new_plugin.appendChild(document.createElement('artifactId')).appendChild(document.createTextNode(PomPlugin.SUREFIRE_ARTIFACT_ID))
+    for plugins_tag in plugins_tags:
+        edit(plugins_tag, PomPlugin.SUREFIRE_ARTIFACT_ID, *args)
+    write_pom(pom_path, document)
+    return True
+
+
+def _edit_pom_in_worker(task):
+    function, pom_path, args = task
+    try:
+        return pom_path, function(pom_path, *args), None
+    except Exception as e:
+        # exceptions are sent back as text, not all of them can be pickled
+        return pom_path, None, '{0}: {1}'.format(type(e).__name__, e)
+
+
+def edit_pom_files(function, pom_paths, args=(), workers=None):
+    """
+    calls function(pom_path, *args) for every pom, on a process pool of the given number of workers (no more than the
+    number of poms). if workers is not given the poms are edited serially, unless there are at least
+    POOL_MIN_POMS_PER_CPU poms per cpu, and then on a pool of cpu count workers.
+    function and args are pickled, so function must be a module-level function.
+    returns the results and the errors of the poms, by pom path
+    """
+    tasks = map(lambda pom_path: (function, pom_path, tuple(args)), pom_paths)
+    if workers is None:
+        cpu_count = multiprocessing.cpu_count()
+        workers = cpu_count if len(tasks) >= POOL_MIN_POMS_PER_CPU * cpu_count else 1
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        done = map(_edit_pom_in_worker, tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            done = pool.map(_edit_pom_in_worker, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+    results = {}
+    errors = {}
+    for pom_path, result, error in done:
+        if error is None:
+            results[pom_path] = result
+        else:
+            errors[pom_path] = error
+    return results, errors
@@ -0,0 +1,305 @@
+import os
+import threading
+import Queue
+import xml.etree.cElementTree as et
+from xml.dom import Node
+from xml.dom.minidom import parse
+
+from pom_file import Pom, write_pom
+
+SURFIRE_DIR_NAME = 'surefire-reports'
+OVERLAY_POM_NAME = 'pom.mvnpy.xml'
+
+
+class ReactorError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return repr(self.msg)
+
+
+class ReactorModule(object):
+    PROJECT_GROUP_IDS = ['${project.groupId}', '${pom.groupId}', '${groupId}']
+
+    def __init__(self, pom_path):
+        self.pom_path = os.path.abspath(pom_path)
+        self.path = os.path.dirname(self.pom_path)
+        root = et.parse(self.pom_path).getroot()
+        self.parent = None
+        parents = Pom.get_children_by_name(root, 'parent')
+        if parents:
+            self.parent = (ReactorModule.get_child_text(parents[0], 'groupId'),
+                           ReactorModule.get_child_text(parents[0], 'artifactId'))
+        self.artifact_id = ReactorModule.get_child_text(root, 'artifactId')
+        self.group_id = ReactorModule.get_child_text(root, 'groupId') or (self.parent[0] if self.parent else None)
+        self.packaging = ReactorModule.get_child_text(root, 'packaging') or 'jar'
+        self.modules = ReactorModule.get_modules(root)
+        self.profile_modules = reduce(list.__add__, map(ReactorModule.get_modules,
+                                                        reduce(list.__add__, map(lambda profiles: Pom.get_children_by_name(profiles, 'profile'),
+                                                                                 Pom.get_children_by_name(root, 'profiles')), [])), [])
+        self.dependencies = []
+        for dependencies in Pom.get_children_by_name(root, 'dependencies'):
+            for dependency in Pom.get_children_by_name(dependencies, 'dependency'):
+                group_id = ReactorModule.get_child_text(dependency, 'groupId')
+                if group_id in ReactorModule.PROJECT_GROUP_IDS:
+                    group_id = self.group_id
+                self.dependencies.append((group_id, ReactorModule.get_child_text(dependency, 'artifactId')))
+
+    # Returns the <module> entries of the <modules> of element (a project or a profile)
+    @staticmethod
+    def get_modules(element):
+        return map(lambda module: module.text.strip(),
+                   reduce(list.__add__, map(lambda modules: Pom.get_children_by_name(modules, 'module'),
+                                            Pom.get_children_by_name(element, 'modules')), []))
+
+    @staticmethod
+    def get_child_text(element, name):
+        children = Pom.get_children_by_name(element, name)
+        if children and children[0].text:
+            return children[0].text.strip()
+        return None
+
+    @property
+    def key(self):
+        return (self.group_id, self.artifact_id)
+
+    # Returns the pom paths of the <modules> of the module, or of the <modules> of its profiles
+    def get_modules_paths(self, profiles=False):
+        return map(lambda module: get_module_pom_path(os.path.normpath(os.path.join(self.path, module))),
+                   self.profile_modules if profiles else self.modules)
+
+    def get_surefire_files(self):
+        surefire_dir = os.path.join(self.path, 'target', SURFIRE_DIR_NAME)
+        if not os.path.isdir(surefire_dir):
+            return []
+        return map(lambda name: os.path.join(surefire_dir, name),
+                   filter(lambda name: name.endswith('.xml'), os.listdir(surefire_dir)))
+
+    def __repr__(self):
+        return "{0}:{1}".format(self.group_id, self.artifact_id)
+
+
+class Reactor(object):
+    """
+    the modules of a maven project, found by following the <modules> of the root pom,
+    and the dependencies between them (<dependencies> and <parent> that are modules of the reactor).
+    the modules that are declared only in the <profiles> of the poms are kept apart (profile_modules), since they
+    are built only when their profile is active. only the poms of the modules are read, so no directory of the
+    project is walked
+    """
+    def __init__(self, root_dir):
+        self.root_dir = os.path.abspath(root_dir)
+        self.modules = []
+        self.profile_modules = []
+        self._module_by_key = {}
+        self._pom_stats = {}
+        self._load(os.path.join(self.root_dir, 'pom.xml'), self.modules)
+        pending = list(self.modules)
+        while pending:
+            loaded = len(self.profile_modules)
+            for module_path in pending.pop(0).get_modules_paths(profiles=True):
+                self._load(module_path, self.profile_modules)
+            pending.extend(self.profile_modules[loaded:])
+
+    @staticmethod
+    def get_pom_stat(pom_path):
+        if not os.path.isfile(pom_path):
+            return None
+        stat = os.stat(pom_path)
+        return stat.st_mtime, stat.st_size
+
+    # Returns true if a pom that was read (or a module pom that was missing) changed since the reactor was loaded
+    def is_stale(self):
+        return any(map(lambda pom_path: Reactor.get_pom_stat(pom_path) != self._pom_stats[pom_path], self._pom_stats))
+
+    # Loads the module of pom_path into modules, and the modules that it declares (not in its profiles)
+    def _load(self, pom_path, modules):
+        pom_path = os.path.abspath(pom_path)
+        self._pom_stats[pom_path] = Reactor.get_pom_stat(pom_path)
+        if self._pom_stats[pom_path] is None:
+            return
+        try:
+            module = ReactorModule(pom_path)
+        except SyntaxError:
+            # assume that file is not valid pom
+            return
+        if module.key in self._module_by_key:
+            return
+        modules.append(module)
+        self._module_by_key[module.key] = module
+        for module_path in module.get_modules_paths():
+            self._load(module_path, modules)
+
+    def get_module(self, artifact_id, group_id=None):
+        modules = filter(lambda module: module.artifact_id == artifact_id and (group_id is None or module.group_id == group_id), self.modules)
+        if not modules:
+            raise ReactorError('{0} is not a module of {1}'.format(artifact_id, self.root_dir))
+        return modules[0]
+
+    def get_module_by_path(self, module_path):
+        module_path = os.path.abspath(module_path)
+        modules = filter(lambda module: module.path == module_path, self.modules)
+        if not modules:
+            raise ReactorError('{0} is not a module of {1}'.format(module_path, self.root_dir))
+        return modules[0]
+
+    def get_all_modules(self):
+        return self.modules + self.profile_modules
+
+    def get_pom_paths(self, root_dir=None):
+        """
+        the poms of the modules and then of the profile modules (in the order they were found),
+        only of the modules in root_dir if it is given
+        """
+        modules = self.get_all_modules()
+        if root_dir is not None:
+            root_dir = os.path.abspath(root_dir)
+            modules = filter(lambda module: module.path == root_dir or module.path.startswith(os.path.join(root_dir, '')), modules)
+        return map(lambda module: module.pom_path, modules)
+
+    def get_dependencies(self, module):
+        keys = list(module.dependencies)
+        if module.parent:
+            keys.append(module.parent)
+        return filter(None, map(self._module_by_key.get, keys))
+
+    def get_parent(self, module):
+        if module.parent is None:
+            return None
+        return self._module_by_key.get(module.parent)
+
+    def get_dependents(self, module):
+        return filter(lambda other: module in self.get_dependencies(other), self.modules)
+
+    def get_build_order(self, modules=None):
+        """
+        the given modules (all by default) sorted so every module comes after the modules it depends on
+        """
+        modules = modules or self.modules
+        dependencies = dict(map(lambda module: (module.key, set(map(lambda dependency: dependency.key, self.get_dependencies(module)))
+                                                 & set(map(lambda m: m.key, modules))), modules))
+        order = []
+        done = set()
+        pending = list(modules)
+        while pending:
+            ready = filter(lambda module: dependencies[module.key] <= done, pending)
+            if not ready:
+                raise ReactorError('cyclic dependencies between {0}'.format(pending))
+            order.extend(ready)
+            done.update(map(lambda module: module.key, ready))
+            pending = filter(lambda module: module.key not in done, pending)
+        return order
+
+
+# Returns the pom of a <module> entry, that is either a directory or a pom file
+def get_module_pom_path(module_path):
+    if module_path.endswith('.xml'):
+        return module_path
+    return os.path.join(module_path, 'pom.xml')
+
+
+def get_overlay_pom_path(pom_path):
+    return os.path.join(os.path.dirname(pom_path), OVERLAY_POM_NAME)
+
+
+def get_dom_children(element, name):
+    return filter(lambda child: child.nodeType == Node.ELEMENT_NODE and child.localName == name, element.childNodes)
+
+
+def set_dom_text(element, text):
+    map(element.removeChild, list(element.childNodes))
+    element.appendChild(element.ownerDocument.createTextNode(text))
+
+
+def write_overlay_poms(reactor, modules=None):
+    """
+    writes a copy of the pom of every module (and profile module) next to it (OVERLAY_POM_NAME), with its <modules>
+    (also those of its profiles) and the <relativePath> of its parent pointing at the copies, so 'mvn -f <root copy>'
+    builds the same reactor (and the same target dirs) from the copies, and the copies can be edited instead of the poms.
+    only the copies of the given modules (all by default) are written. returns the path of the root copy
+    """
+    for module in (reactor.get_all_modules() if modules is None else modules):
+        document = parse(module.pom_path)
+        project = document.documentElement
+        modules_elements = get_dom_children(project, 'modules')
+        for profiles in get_dom_children(project, 'profiles'):
+            for profile in get_dom_children(profiles, 'profile'):
+                modules_elements.extend(get_dom_children(profile, 'modules'))
+        for modules in modules_elements:
+            for module_element in get_dom_children(modules, 'module'):
+                module_path = get_module_pom_path(os.path.normpath(os.path.join(module.path, module_element.firstChild.data.strip())))
+                if os.path.isfile(module_path):
+                    set_dom_text(module_element, os.path.relpath(get_overlay_pom_path(module_path), module.path).replace(os.path.sep, '/'))
+        parent_module = reactor.get_parent(module)
+        if parent_module is not None:
+            parent = get_dom_children(project, 'parent')[0]
+            relative_paths = get_dom_children(parent, 'relativePath')
+            if relative_paths:
+                relative_path = relative_paths[0]
+            else:
+                relative_path = parent.appendChild(document.createElement('relativePath'))
+            set_dom_text(relative_path, os.path.relpath(get_overlay_pom_path(parent_module.pom_path), module.path).replace(os.path.sep, '/'))
+        write_pom(get_overlay_pom_path(module.pom_path), document, source_path=module.pom_path)
+    return get_overlay_pom_path(os.path.join(reactor.root_dir, 'pom.xml'))
+
+
+def remove_overlay_poms(reactor):
+    for module in reactor.get_all_modules():
+        if os.path.isfile(get_overlay_pom_path(module.pom_path)):
+            os.remove(get_overlay_pom_path(module.pom_path))
+
+
+class ReactorBuildResult(object):
+    def __init__(self, modules, module_reports, test_results):
+        self.modules = modules
+        self.module_reports = module_reports
+        self.test_results = test_results
+
+    @property
+    def build_report(self):
+        return '\n'.join(map(lambda module: self.module_reports[module.key], self.modules))
+
+    def get_failed_modules(self):
+        return filter(lambda module: '[INFO] BUILD SUCCESS' not in self.module_reports[module.key], self.modules)
+
+
+def run_in_dependency_order(reactor, run_module, max_workers=1, modules=None):
+    """
+    calls run_module(module) for every module (all by default) on its own thread, at most max_workers at once.
+    a module starts only after all the given modules it depends on are done. returns the results by module key
+    """
+    order = reactor.get_build_order(modules)
+    keys = set(map(lambda module: module.key, order))
+    dependencies = dict(map(lambda module: (module.key, set(map(lambda dependency: dependency.key, reactor.get_dependencies(module))) & keys), order))
+    done_queue = Queue.Queue()
+
+    def run(module):
+        try:
+            done_queue.put((module, run_module(module), None))
+        except Exception as e:
+            done_queue.put((module, None, e))
+
+    max_workers = max(max_workers, 1)
+    results = {}
+    pending = list(order)
+    running = 0
+    error = None
+    while running or (pending and error is None):
+        if error is None:
+            ready = filter(lambda module: dependencies[module.key] <= set(results.keys()), pending)
+            for module in ready[:max_workers - running]:
+                pending.remove(module)
+                thread = threading.Thread(target=run, args=(module,))
+                thread.daemon = True
+                thread.start()
+                running += 1
+        module, result, exception = done_queue.get()
+        running -= 1
+        if exception is not None:
+            error = error or exception
+            continue
+        results[module.key] = result
+    if error is not None:
+        raise error
+    return results
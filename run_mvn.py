@@ -9,6 +9,7 @@ import shutil
 import xml.etree.ElementTree
 import tempfile
 from contextlib import contextmanager
+from reactor import Reactor, get_overlay_pom_path, remove_overlay_poms, write_overlay_poms
 
 SURFIRE_DIR_NAME = 'surefire-reports'
 OBSERVE_PATH = r"c:\temp\observe"
@@ -64,31 +65,57 @@ class Tracer(object):
     def trace(self):
         yield
 
+    # the pom (or directory) that mvn should build while tracing
+    def get_mvn_pom(self, git_path):
+        return git_path
+
 class JcovTracer(object):
     pass
 
 class AmirTracer(Tracer):
-    def __init__(self, git_path, tracer_path, copy_traces_to):
+    """
+    with overlay the tracer is added to copies of the poms of the reactor (see reactor.write_overlay_poms) that are
+    removed after tracing, so the poms of the repo are never edited
+    """
+    def __init__(self, git_path, tracer_path, copy_traces_to, overlay=False):
         super(AmirTracer, self).__init__()
         self.tracer_path = tracer_path
         self.git_path = git_path
         self.paths_file = tempfile.mktemp()
         self.copy_traces_to = copy_traces_to
+        self.overlay = overlay
+        self.overlay_root = None
         self.traces = {}
 
     @contextmanager
     def trace(self):
         self.enable_tracer()
-        yield
+        try:
+            yield
+        finally:
+            self.disable_tracer()
         self.collect_traces()
         os.remove(self.paths_file)
 
     def enable_tracer(self):
+        if self.overlay:
+            reactor = Reactor(self.git_path)
+            self.overlay_root = write_overlay_poms(reactor)
+            map(self.fix_pom_file, map(get_overlay_pom_path, reactor.get_pom_paths()))
+            return
         poms = []
         for root, _, files in os.walk(self.git_path):
             poms.extend(map(lambda name: os.path.join(root, name), filter(lambda name: name == "pom.xml", files)))
         map(self.fix_pom_file, poms)
 
+    def disable_tracer(self):
+        if self.overlay_root is not None:
+            remove_overlay_poms(Reactor(self.git_path))
+            self.overlay_root = None
+
+    def get_mvn_pom(self, git_path):
+        return self.overlay_root or git_path
+
     def fix_pom_file(self, pom_path):
         xml.etree.ElementTree.register_namespace('', "http://maven.apache.org/POM/4.0.0")
         xml.etree.ElementTree.register_namespace('xsi', "http://www.w3.org/2001/XMLSchema-instance")
@@ -148,7 +175,7 @@ class TestRunner(object):
         self.observations = self.observe_tests()
 
     def run_mvn(self):
-        os.system(r'mvn install -fn  -f {0}'.format(self.git_path))
+        os.system(r'mvn install -fn  -f {0}'.format(self.tracer.get_mvn_pom(self.git_path)))
 
     def observe_tests(self):
         outcomes = {}
@@ -200,14 +227,11 @@ if __name__ == "__main__":
         predictions = dict(map(lambda line: (line[0].replace(".java", "").replace(os.path.sep, ".").lower(), line[1]), lines))
     tr = TestRunner(repo, AmirTracer(repo, tracer_path))
     tr.run()
-    from sfl_diagnoser.Diagnoser.diagnoserUtils import write_planning_file
-    tests = set(tr.tracer.traces.keys()) & set(tr.observations.keys())
+    from coverage_matrix import Granularity, build_coverage_matrix
+    matrix = build_coverage_matrix(tr.tracer.traces, tr.observations, Granularity.FILES)
     components_priors = {}
-    for component in set(reduce(list.__add__, map(lambda test_name: tr.tracer.traces[test_name].files_trace(), tests), [])):
+    for component in matrix.components:
         for prediction in predictions:
             if component in prediction:
                 components_priors[component] = predictions[prediction]
-    components = set(components_priors.keys())
-    tests_details = map(lambda test_name: (test_name, list(set(tr.tracer.traces[test_name].files_trace()) & components), tr.observations[test_name].get_observation()),
-                        tests)
-    write_planning_file(matrix_path, [], filter(lambda test: len(test[1]) > 0, tests_details), priors=components_priors)
\ No newline at end of file
+    matrix.select_components(components_priors.keys()).write_planning_file(matrix_path, priors=components_priors)
@@ -0,0 +1,68 @@
+import heapq
+
+
+class Shard(object):
+    REPORT_NAME_SUFFIX = 'shard{0}'
+
+    def __init__(self, index):
+        self.index = index
+        self.test_classes = []
+        self.cost = 0.0
+        self.build_report = None
+        self.reports_dir = None
+
+    @property
+    def report_name_suffix(self):
+        return Shard.REPORT_NAME_SUFFIX.format(self.index)
+
+    def get_mvn_names(self):
+        return map(get_mvn_name, self.test_classes)
+
+    def add(self, test_class, cost):
+        self.test_classes.append(test_class)
+        self.cost += cost
+
+    def __repr__(self):
+        return "{0}: {1} test classes, {2:.2f}s".format(self.report_name_suffix, len(self.test_classes), self.cost)
+
+
+def get_mvn_name(test_class):
+    return getattr(test_class, 'mvn_name', test_class)
+
+
+# Returns the time of every test class in the given TestClassReports
+def get_test_classes_costs(reports):
+    costs = {}
+    for report in reports:
+        costs[report.name] = costs.get(report.name, 0.0) + report.time
+    return costs
+
+
+def get_default_cost(costs):
+    if not costs:
+        return 1.0
+    values = sorted(costs.values())
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def plan_shards(test_classes, costs, shards_count, default_cost=None):
+    """
+    splits test classes (TestClass objects or mvn names) into at most shards_count shards of about the same time.
+    costs are the historical times by mvn name (see get_test_classes_costs). test classes without a time get
+    default_cost, the median of the known times by default. the longest test class is always added to the
+    shortest shard (LPT), so no shard takes more than 4/3 of the optimal time
+    """
+    if default_cost is None:
+        default_cost = get_default_cost(costs)
+    shards = map(Shard, xrange(max(shards_count, 1)))
+    heap = map(lambda shard: (shard.cost, shard.index), shards)
+    weighted = sorted(map(lambda test_class: (costs.get(get_mvn_name(test_class), default_cost), get_mvn_name(test_class), test_class), test_classes),
+                      key=lambda weighted_test: (-weighted_test[0], weighted_test[1]))
+    for cost, _, test_class in weighted:
+        _, index = heapq.heappop(heap)
+        shards[index].add(test_class, cost)
+        heapq.heappush(heap, (shards[index].cost, index))
+    return filter(lambda shard: shard.test_classes, shards)
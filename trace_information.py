@@ -1,4 +1,8 @@
+import json
 import re
+from array import array
+from collections import Counter
+from itertools import chain
 
 
 class PrimitiveTypes(object):
@@ -10,18 +14,44 @@ class PrimitiveTypes(object):
         return PrimitiveTypes.PRIMITIVES[primitive]
 
 
+def _intern(name):
+    return intern(name) if type(name) is str else name
+
+
 class Signature(object):
     MATCHER = re.compile("\\(([^\\)]*)\\)(.*)")
+    CACHE_SIZE = 2 ** 14
+    _DECODED = {}
+    _TYPE_NAMES = {}
 
     def __init__(self, vmsig, short_type=False):
         self.vmsig = vmsig
         m = Signature.MATCHER.match(self.vmsig)
         self.return_value = Signature.convert_vm_type(m.group(2))
-        self.args = Signature.get_args(m.group(1), short_type)
+        self.args = _intern(Signature.get_args(m.group(1), short_type))
+
+    @staticmethod
+    def decode(vmsig, short_type=False):
+        """
+        returns the Signature of vmsig. identical signatures share a single cached object, so it must not be modified
+        """
+        key = (vmsig, short_type)
+        signature = Signature._DECODED.get(key)
+        if signature is None:
+            if len(Signature._DECODED) >= Signature.CACHE_SIZE:
+                Signature._DECODED.clear()
+            signature = Signature._DECODED[key] = Signature(vmsig, short_type)
+        return signature
 
     @staticmethod
     def convert_vm_type(vm_type):
-        return Signature.get_type_name(vm_type.replace('/', '.').replace('$', '.'))
+        type_name = Signature._TYPE_NAMES.get(vm_type)
+        if type_name is None:
+            if len(Signature._TYPE_NAMES) >= Signature.CACHE_SIZE:
+                Signature._TYPE_NAMES.clear()
+            type_name = Signature._TYPE_NAMES[vm_type] = _intern(
+                Signature.get_type_name(vm_type.replace('/', '.').replace('$', '.')))
+        return type_name
 
     @staticmethod
     def get_type_name(vm_type):
@@ -67,7 +97,21 @@ class Signature(object):
         return args
 
 
+class HitInformationError(ValueError):
+    def __init__(self, msg):
+        super(HitInformationError, self).__init__(msg)
+        self.msg = msg
+
+
 class HitInformation(object):
+    HIT_TYPE = 'l'
+    EXECUTION = 'execution'
+    CALL_GRAPH = 'call_graph'
+    SCANNER = json.JSONDecoder().scan_once
+    CACHE_SIZE = 2 ** 16
+    CACHED_MAX_LENGTH = 64
+    _DECODED = {}
+
     def __init__(self, method_name, lst):
         assert len(lst) == 3
         self.method_name = method_name
@@ -79,13 +123,52 @@ class HitInformation(object):
         self.execution_edge = (self.previous_method, self.method_name)
         self.call_graph_edge = (self.parent_method, self.method_name)
 
+    def get_edge(self, edge_type):
+        return self.execution_edge if edge_type == HitInformation.EXECUTION else self.call_graph_edge
+
+    def get_source_slot(self, edge_type):
+        return self.previous_slot if edge_type == HitInformation.EXECUTION else self.parent
+
     @staticmethod
     def read_hit_information_string(str, method_name):
-        return map(lambda lst: HitInformation(method_name, lst), eval(str))
+        hits = HitInformation.decode(str)
+        return map(lambda ind: HitInformation(method_name, hits[ind: ind + 3]), xrange(0, len(hits), 3))
+
+    @staticmethod
+    def decode(hit_information):
+        """
+        decodes the jcov HitInformation attribute, a list of [count, previous_slot, parent] triples,
+        into a flat array of ints: [count_1, previous_slot_1, parent_1, count_2, ...].
+        short strings repeat a lot between methods and tests, so their arrays are cached and must not be modified
+        """
+        hits = HitInformation._DECODED.get(hit_information)
+        if hits is None:
+            hits = HitInformation._decode(hit_information)
+            if len(hit_information) <= HitInformation.CACHED_MAX_LENGTH:
+                if len(HitInformation._DECODED) >= HitInformation.CACHE_SIZE:
+                    HitInformation._DECODED.clear()
+                HitInformation._DECODED[hit_information] = hits
+        return hits
+
+    @staticmethod
+    def _decode(hit_information):
+        try:
+            hits, end = HitInformation.SCANNER(hit_information, 0)
+            if end == len(hit_information) and type(hits) is list:
+                if len(hits) == 1 and type(hits[0]) is list and len(hits[0]) == 3:
+                    # the common form, a single triple, is converted as it is (array checks that its items are ints)
+                    return array(HitInformation.HIT_TYPE, hits[0])
+                if map(len, hits).count(3) == len(hits):
+                    return array(HitInformation.HIT_TYPE, chain.from_iterable(hits))
+            raise ValueError("expected a list of [count, previous_slot, parent] triples")
+        except StopIteration:
+            raise HitInformationError("malformed HitInformation {0}: not a list".format(hit_information[:100]))
+        except (ValueError, TypeError, OverflowError) as e:
+            raise HitInformationError("malformed HitInformation {0}: {1}".format(hit_information[:100], e))
 
 
 class TraceElement(object):
-    def __init__(self, jcov_data, method_name_by_id):
+    def __init__(self, jcov_data, method_name_by_id, lazy_hits=False):
         self.jcov_data = jcov_data
         self.id = int(self.jcov_data['id'])
         extra_slot = int(self.jcov_data['extra_slots'])
@@ -93,22 +176,43 @@ class TraceElement(object):
             self.extra_slot = extra_slot
         self.count = int(self.jcov_data['count'])
         self.method_name = method_name_by_id[self.id]
-        self.hits_information = []
-        if self.count:
-            self.hits_information = HitInformation.read_hit_information_string(self.jcov_data['HitInformation'], self.method_name)
-            # assert sum(map(lambda x: x.count, self.hits_information)) == self.count, "{0}-{1}, {2}".format(self.id, self.method_name, self.count)
+        self._hits_information = None
+        self._method_name_by_slot = None
+        if not lazy_hits:
+            self._hits_information = self._read_hits_information()
+
+    # with lazy_hits the HitInformation string is decoded only on the first access
+    @property
+    def hits_information(self):
+        if self._hits_information is None:
+            self._hits_information = self._read_hits_information()
+            if self._method_name_by_slot is not None:
+                map(lambda hit: hit.set_previous_method(self._method_name_by_slot), self._hits_information)
+        return self._hits_information
+
+    def _read_hits_information(self):
+        if not self.count:
+            return []
+        # assert sum(map(lambda x: x.count, self.hits_information)) == self.count, "{0}-{1}, {2}".format(self.id, self.method_name, self.count)
+        return HitInformation.read_hit_information_string(self.jcov_data['HitInformation'], self.method_name)
 
     def set_previous_method(self, method_name_by_id):
-        map(lambda hit: hit.set_previous_method(method_name_by_id), self.hits_information)
+        self._method_name_by_slot = method_name_by_id
+        if self._hits_information is not None:
+            map(lambda hit: hit.set_previous_method(method_name_by_id), self._hits_information)
 
     def have_count(self):
         return self.count != 0
 
     def get_trace(self, trace_granularity='methods'):
+        return TraceElement.get_method_trace(self.method_name, trace_granularity)
+
+    @staticmethod
+    def get_method_trace(method_name, trace_granularity='methods'):
         if trace_granularity == 'methods':
-            return self.method_name
+            return method_name
         elif trace_granularity == 'files':
-            return ".".join((self.method_name.split("(")[0].split(".")[:-1]))
+            return ".".join((method_name.split("(")[0].split(".")[:-1]))
         assert False
 
     def get_execution_edges(self):
@@ -117,6 +221,18 @@ class TraceElement(object):
     def get_call_graph_edges(self):
         return map(lambda hit: hit.call_graph_edge, self.hits_information)
 
+    def add_edge_counts(self, counts, edge_type=HitInformation.EXECUTION, id_by_slot=None):
+        """
+        adds the hit counts of the edges into this element to counts. the edges are keyed by method names,
+        or by (source id, id) pairs if id_by_slot is given (-1 as the source id when there is none)
+        """
+        for hit in self.hits_information:
+            if id_by_slot is None:
+                counts[hit.get_edge(edge_type)] += hit.count
+            else:
+                counts[(id_by_slot.get(hit.get_source_slot(edge_type), -1), self.id)] += hit.count
+        return counts
+
 
 class Trace(object):
     def __init__(self, test_name, trace):
@@ -127,7 +243,126 @@ class Trace(object):
         return list(set(map(lambda t: self.trace[t].get_trace(trace_granularity), self.trace)))
 
     def get_execution_edges(self):
-        return reduce(list.__add__, map(lambda element: element.get_execution_edges(), self.trace.values()), [])
+        return list(chain.from_iterable(map(lambda element: element.get_execution_edges(), self.trace.values())))
+
+    def get_call_graph_edges(self):
+        return list(chain.from_iterable(map(lambda element: element.get_call_graph_edges(), self.trace.values())))
+
+    def get_id_by_extra_slot(self):
+        return dict(map(lambda e: (e.extra_slot, e.id), filter(lambda e: hasattr(e, 'extra_slot'), self.trace.values())))
+
+    def get_edge_counts(self, edge_type=HitInformation.EXECUTION, by_id=False, counts=None):
+        """
+        returns a Counter of edge -> sum of the hits counts of the edge, adding to counts if given
+        """
+        counts = Counter() if counts is None else counts
+        id_by_slot = self.get_id_by_extra_slot() if by_id else None
+        for element in self.trace.values():
+            element.add_edge_counts(counts, edge_type, id_by_slot)
+        return counts
+
+
+class CompactTrace(object):
+    """
+    Trace backed by typed arrays instead of TraceElement and HitInformation objects.
+    For every covered method it keeps its id, extra slot and count, and its hits as flat
+    (count, previous_slot, parent) triples. hits_offsets[i]:hits_offsets[i + 1] are the hits of the i-th method.
+    Method names are resolved through method_name_by_id only when asked for.
+    """
+    ID_TYPE = 'i'
+    COUNT_TYPE = HitInformation.HIT_TYPE
+
+    def __init__(self, test_name, method_name_by_id, ids=None, extra_slots=None, counts=None, hits_offsets=None,
+                 hits=None):
+        self.test_name = test_name
+        self.method_name_by_id = method_name_by_id
+        self.ids = ids if ids is not None else array(CompactTrace.ID_TYPE)
+        self.extra_slots = extra_slots if extra_slots is not None else array(CompactTrace.ID_TYPE)
+        self.counts = counts if counts is not None else array(CompactTrace.COUNT_TYPE)
+        self.hits_offsets = hits_offsets if hits_offsets is not None else array(CompactTrace.ID_TYPE, [0])
+        self.hits = hits if hits is not None else array(CompactTrace.COUNT_TYPE)
+
+    @staticmethod
+    def from_trace(trace, method_name_by_id):
+        compact_trace = CompactTrace(trace.test_name, method_name_by_id)
+        for element in trace.trace.values():
+            compact_trace.ids.append(element.id)
+            compact_trace.extra_slots.append(getattr(element, 'extra_slot', -1))
+            compact_trace.counts.append(element.count)
+            for hit in element.hits_information:
+                compact_trace.hits.extend([hit.count, hit.previous_slot, hit.parent])
+            compact_trace.hits_offsets.append(len(compact_trace.hits) // 3)
+        return compact_trace
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['method_name_by_id'] = None
+        return state
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, jcov_data):
+        count = int(jcov_data['count'])
+        if count == 0:
+            return
+        self.ids.append(int(jcov_data['id']))
+        self.extra_slots.append(int(jcov_data['extra_slots']))
+        self.counts.append(count)
+        self.hits.extend(HitInformation.decode(jcov_data['HitInformation']))
+        self.hits_offsets.append(len(self.hits) // 3)
+
+    def get_method_names(self):
+        return map(self.method_name_by_id.__getitem__, self.ids)
+
+    def get_trace(self, trace_granularity='methods'):
+        return list(set(map(lambda name: TraceElement.get_method_trace(name, trace_granularity), self.get_method_names())))
+
+    def get_method_name_by_extra_slot(self):
+        method_name_by_extra_slot = dict((slot, self.method_name_by_id[id]) for id, slot in zip(self.ids, self.extra_slots) if slot != -1)
+        method_name_by_extra_slot[-1] = 'None'
+        return method_name_by_extra_slot
+
+    def iter_hits(self):
+        """
+        yields (method_id, count, previous_slot, parent) for every hit
+        """
+        for ind, id in enumerate(self.ids):
+            for hit in xrange(self.hits_offsets[ind], self.hits_offsets[ind + 1]):
+                yield id, self.hits[3 * hit], self.hits[3 * hit + 1], self.hits[3 * hit + 2]
+
+    def _get_edges(self, slot_index):
+        method_name_by_extra_slot = self.get_method_name_by_extra_slot()
+        return map(lambda hit: (method_name_by_extra_slot.get(hit[slot_index], 'None'), self.method_name_by_id[hit[0]]),
+                   self.iter_hits())
+
+    def get_execution_edges(self):
+        return self._get_edges(2)
 
     def get_call_graph_edges(self):
-        return reduce(list.__add__, map(lambda element: element.get_call_graph_edges(), self.trace.values()), [])
\ No newline at end of file
+        return self._get_edges(3)
+
+    def get_edge_counts(self, edge_type=HitInformation.EXECUTION, by_id=False, counts=None):
+        counts = Counter() if counts is None else counts
+        slot_index = 2 if edge_type == HitInformation.EXECUTION else 3
+        if by_id:
+            source_by_slot = dict((slot, id) for id, slot in zip(self.ids, self.extra_slots) if slot != -1)
+            target_by_id = dict((id, id) for id in self.ids)
+            default = -1
+        else:
+            source_by_slot = self.get_method_name_by_extra_slot()
+            target_by_id = self.method_name_by_id
+            default = 'None'
+        for hit in self.iter_hits():
+            counts[(source_by_slot.get(hit[slot_index], default), target_by_id[hit[0]])] += hit[1]
+        return counts
+
+
+def aggregate_edge_counts(traces, edge_type=HitInformation.EXECUTION, by_id=False):
+    """
+    sums the edge counts of many traces (Trace or CompactTrace) in a single Counter
+    """
+    counts = Counter()
+    for trace in traces:
+        trace.get_edge_counts(edge_type, by_id, counts)
+    return counts
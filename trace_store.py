@@ -0,0 +1,176 @@
+import marshal
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+from array import array
+
+from jcov_parser import JcovParser
+from trace_information import CompactTrace
+
+
+class TraceStoreError(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return repr(self.msg)
+
+
+class TraceStore(object):
+    """
+    Binary file of CompactTraces:
+        header | arrays of the first test | arrays of the second test | ... | index | footer
+    The index keeps the shared method names table and, for every test, the offset and length of each of its arrays.
+    The footer is the offset of the index followed by the magic.
+    The file is memory mapped, so reading a single test only reads its own arrays.
+    """
+    MAGIC = 'MVNPYTRC'
+    VERSION = 1
+    HEADER = struct.Struct('<8sI')
+    FOOTER = struct.Struct('<Q8s')
+    ARRAYS = ['ids', 'extra_slots', 'counts', 'hits_offsets', 'hits']
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self._file = open(store_path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            self._file.close()
+            raise TraceStoreError('{0} is not a trace store'.format(store_path))
+        if len(self._mmap) < TraceStore.HEADER.size + TraceStore.FOOTER.size:
+            self.close()
+            raise TraceStoreError('{0} is not a trace store'.format(store_path))
+        magic, version = TraceStore.HEADER.unpack_from(self._mmap, 0)
+        index_offset, footer_magic = TraceStore.FOOTER.unpack_from(self._mmap, len(self._mmap) - TraceStore.FOOTER.size)
+        if magic != TraceStore.MAGIC or footer_magic != TraceStore.MAGIC:
+            self.close()
+            raise TraceStoreError('{0} is not a trace store'.format(store_path))
+        if version != TraceStore.VERSION:
+            self.close()
+            raise TraceStoreError('{0} has version {1}, expected {2}'.format(store_path, version, TraceStore.VERSION))
+        index = marshal.loads(self._mmap[index_offset: len(self._mmap) - TraceStore.FOOTER.size])
+        self.byteorder = index['byteorder']
+        self.method_name_by_id = index['method_name_by_id']
+        self._tests = index['tests']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __len__(self):
+        return len(self._tests)
+
+    def __contains__(self, test_name):
+        return test_name in self._tests
+
+    def get_test_names(self):
+        return self._tests.keys()
+
+    def get_trace(self, test_name):
+        if test_name not in self._tests:
+            raise TraceStoreError('{0} is not in {1}'.format(test_name, self.store_path))
+        arrays = {}
+        for name, (typecode, itemsize, offset, length) in zip(TraceStore.ARRAYS, self._tests[test_name]):
+            values = array(typecode)
+            if values.itemsize != itemsize:
+                raise TraceStoreError('{0} was written on a platform with a different {1} size'.format(self.store_path, typecode))
+            values.fromstring(self._mmap[offset: offset + length])
+            if self.byteorder != sys.byteorder:
+                values.byteswap()
+            arrays[name] = values
+        return CompactTrace(test_name, self.method_name_by_id, **arrays)
+
+    def get_traces(self):
+        for test_name in self._tests:
+            yield self.get_trace(test_name)
+
+
+class TraceStoreWriter(object):
+    """
+    writes a TraceStore to a temporary file next to store_path, that is renamed to store_path by close, after the
+    index and the footer are written. abort (or an exception in the with block) deletes it, so store_path is
+    never a partly written store
+    """
+    def __init__(self, store_path, method_name_by_id):
+        self.store_path = store_path
+        self.method_name_by_id = method_name_by_id
+        self._tests = {}
+        self._tmp_path = "{0}.{1}.tmp".format(store_path, os.getpid())
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(TraceStore.HEADER.pack(TraceStore.MAGIC, TraceStore.VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, trace):
+        if not isinstance(trace, CompactTrace):
+            trace = CompactTrace.from_trace(trace, self.method_name_by_id)
+        assert trace.test_name not in self._tests, '{0} was already added'.format(trace.test_name)
+        arrays = []
+        for name in TraceStore.ARRAYS:
+            values = getattr(trace, name)
+            offset = self._file.tell()
+            values.tofile(self._file)
+            arrays.append((values.typecode, values.itemsize, offset, self._file.tell() - offset))
+        self._tests[trace.test_name] = arrays
+
+    def close(self):
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        try:
+            marshal.dump({'byteorder': sys.byteorder, 'method_name_by_id': self.method_name_by_id, 'tests': self._tests}, self._file)
+            self._file.write(TraceStore.FOOTER.pack(index_offset, TraceStore.MAGIC))
+        except:
+            self.abort()
+            raise
+        self._file.close()
+        if sys.platform == 'win32' and os.path.exists(self.store_path):
+            # os.rename does not replace an existing file on windows
+            os.remove(self.store_path)
+        os.rename(self._tmp_path, self.store_path)
+
+    # Deletes the partly written store
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def write_trace_store(store_path, traces, method_name_by_id):
+    with TraceStoreWriter(store_path, method_name_by_id) as writer:
+        for trace in traces:
+            writer.add(trace)
+    return store_path
+
+
+def convert_xml_dir(xml_folder_dir, store_path, instrument_only_methods=True, short_type=True, workers=None):
+    """
+    parses a directory of jcov result xmls into a trace store. workers > 1 parses over a process pool
+    """
+    parser = JcovParser(xml_folder_dir, instrument_only_methods, short_type, compact=True)
+    if workers is not None and workers > 1:
+        traces = parser.parallel_parse(workers, ordered=False)
+    else:
+        traces = parser.stream_parse()
+    return write_trace_store(store_path, traces, parser.method_name_by_id)
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) == 3, "usage: trace_store.py <jcov xmls dir> <store path>"
+    convert_xml_dir(sys.argv[1], sys.argv[2], workers=multiprocessing.cpu_count())